@@ -1,5 +1,11 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone
+import asyncio
 from ..services.ai_service import ai_service
+from ..services.prompt_packing import (
+    item_value, item_allowance, item_tokens, fit_to_tokens, decision, summarize_decisions, pack_items
+)
+from ..core.config import settings
 
 class AnalysisAgent:
     """AI Analysis Agent - Performs analysis using AI models"""
@@ -43,22 +49,189 @@ class AnalysisAgent:
                 "error": str(e)
             }
     
+    def fallback_analysis(self, data: List[Dict[str, Any]], analysis_type: str = "summary") -> Dict[str, Any]:
+        """Basic analysis with the usual metadata, for runs out of time to wait on the AI"""
+        result = self._basic_analysis(data, analysis_type)
+        result.update({
+            "data_count": len(data),
+            "sources": list(set([item.get("source", "unknown") for item in data])),
+            "analysis_type": analysis_type,
+            "timestamp": self._get_current_timestamp(),
+            "analysis_mode": "full",
+            "incremental_runs": 0
+        })
+        return result
+    
+    def start_streaming(self, analysis_type: str = "summary") -> "StreamingAnalysis":
+        """Begin an analysis that is fed items while collection is still running"""
+        return StreamingAnalysis(self, analysis_type)
+    
+    def needs_full_refresh(self, analysis_type: str, previous: Optional[Dict[str, Any]],
+                           new_items: List[Dict[str, Any]]) -> bool:
+        """Whether a run must re-analyze its window instead of updating the previous analysis"""
+        refresh_every = settings.INCREMENTAL_ANALYSIS_TYPES.get(analysis_type)
+        if not refresh_every or not previous or previous.get("error") or previous.get("partial"):
+            return True
+        if previous.get("analysis_type") != analysis_type:
+            return True
+        if previous.get("incremental_runs", 0) + 1 >= refresh_every:
+            return True
+        
+        # Drift: the new items outweigh what the previous analysis was built from
+        window = previous.get("window_count") or previous.get("data_count") or 0
+        if len(new_items) > settings.INCREMENTAL_DRIFT_RATIO * max(window, 1):
+            return True
+        return len(self.ai_service.chunk_items(new_items, self.ai_service.prompt_token_budget())) > 1
+    
+    async def update_analysis(self, data: List[Dict[str, Any]], new_items: List[Dict[str, Any]],
+                              previous: Dict[str, Any], analysis_type: str = "summary") -> Dict[str, Any]:
+        """Fold only the new items into the previous analysis"""
+        if new_items:
+            budget = self.ai_service.prompt_token_budget()
+            batches, decisions = pack_items(new_items, budget, 1)
+            prompt = self.ai_service._build_incremental_prompt(previous, batches[0], analysis_type)
+            result = await self._complete_with_fallback(prompt)
+            result = self._parse_ai_response(result["analysis"], analysis_type)
+            result["packing"] = summarize_decisions(decisions, budget)
+        else:
+            # Nothing new since the last run; carry the previous analysis forward
+            result = {
+                key: previous.get(key, default)
+                for key, default in (("analysis", ""), ("summary", ""), ("key_points", []), ("sentiment", "neutral"))
+            }
+        
+        window = previous.get("window_count") or previous.get("data_count") or 0
+        result.update({
+            "data_count": len(data),
+            "new_items": len(new_items),
+            "window_count": min(window + len(new_items), settings.INCREMENTAL_WINDOW_ITEMS),
+            "analysis_mode": "incremental",
+            "incremental_runs": previous.get("incremental_runs", 0) + 1,
+            "sources": list(set([item.get("source", "unknown") for item in data])),
+            "analysis_type": analysis_type,
+            "timestamp": self._get_current_timestamp()
+        })
+        return result
+
     async def _try_analysis_with_fallback(self, data: List[Dict[str, Any]], analysis_type: str) -> Dict[str, Any]:
-        """Try analysis with OpenAI, fallback to DeepSeek"""
+        """Pack the most valuable items into the prompt budget, then analyze them in one request or map-reduce them"""
+        budget = self.ai_service.prompt_token_budget()
+        batches, decisions = pack_items(data, budget, settings.ANALYSIS_MAX_BATCHES)
+        if len(batches) <= 1:
+            result = await self._analyze_batch(batches[0], analysis_type)
+        else:
+            result = await self._map_reduce_analysis(batches, analysis_type)
+        result["packing"] = summarize_decisions(decisions, budget * settings.ANALYSIS_MAX_BATCHES)
+        return result
+    
+    async def _analyze_batch(self, data: List[Dict[str, Any]], analysis_type: str) -> Dict[str, Any]:
+        """Analyze one prompt-sized batch, falling back to basic analysis"""
+        prompt = self.ai_service._build_prompt(data, analysis_type)
         try:
-            # Try OpenAI first
-            result = await self.ai_service.analyze_with_openai(data, analysis_type)
+            result = await self._complete_with_fallback(prompt)
             return self._parse_ai_response(result["analysis"], analysis_type)
-        except Exception as openai_error:
-            print(f"OpenAI failed: {openai_error}")
+        except Exception:
+            # Final fallback - basic analysis
+            return self._basic_analysis(data, analysis_type)
+    
+    async def _map_reduce_analysis(self, batches: List[List[Dict[str, Any]]], analysis_type: str) -> Dict[str, Any]:
+        """Analyze batches concurrently, then merge the partial results"""
+        semaphore = asyncio.Semaphore(settings.ANALYSIS_MAX_CONCURRENCY)
+        
+        async def analyze(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._analyze_batch(batch, analysis_type)
+        
+        partials = await asyncio.gather(*[analyze(batch) for batch in batches])
+        return await self._reduce_partials(list(partials), analysis_type)
+    
+    async def _reduce_partials(self, partials: List[Dict[str, Any]], analysis_type: str) -> Dict[str, Any]:
+        """Merge per-batch analyses with one more call, or locally if that fails"""
+        prompt = self.ai_service._build_reduce_prompt(partials, analysis_type)
+        try:
+            result = await self._complete_with_fallback(prompt)
+            merged = self._parse_ai_response(result["analysis"], analysis_type)
+        except Exception:
+            merged = self._merge_partials(partials)
+        
+        merged["batches"] = len(partials)
+        return merged
+    
+    async def _complete_with_fallback(self, prompt: str) -> Dict[str, Any]:
+        """Try the prompt with OpenAI, fallback to DeepSeek, skipping providers with an open breaker"""
+        # Identical prompts over an unchanged window reuse the earlier completion
+        cached = await self.ai_service.get_cached_completion(prompt)
+        if cached:
+            return cached
+        
+        providers = [
+            provider for provider in ("openai", "deepseek")
+            if self.ai_service.is_configured(provider) and self.ai_service.breakers[provider].is_available()
+        ]
+        if not providers:
+            raise Exception("No AI provider available")
+        
+        if settings.ANALYSIS_HEDGING_ENABLED and len(providers) > 1:
+            return await self._hedged_completion(prompt, providers[0], providers[1])
+        
+        last_error = None
+        for provider in providers:
             try:
-                # Fallback to DeepSeek
-                result = await self.ai_service.analyze_with_deepseek(data, analysis_type)
-                return self._parse_ai_response(result["analysis"], analysis_type)
-            except Exception as deepseek_error:
-                print(f"DeepSeek failed: {deepseek_error}")
-                # Final fallback - basic analysis
-                return self._basic_analysis(data, analysis_type)
+                return await self.ai_service.complete(provider, prompt)
+            except Exception as e:
+                print(f"{provider} failed: {e}")
+                last_error = e
+        raise last_error
+    
+    async def _hedged_completion(self, prompt: str, primary: str, secondary: str) -> Dict[str, Any]:
+        """Fire the secondary provider if the primary is slower than its p95, keep the first success"""
+        p95 = self.ai_service.breakers[primary].latency_percentile(0.95)
+        delay = max(settings.ANALYSIS_HEDGE_MIN_DELAY, p95 if p95 is not None else settings.ANALYSIS_HEDGE_DEFAULT_DELAY)
+        
+        pending = {asyncio.create_task(self.ai_service.complete(primary, prompt))}
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        
+        # The primary answered or failed within the delay
+        if done:
+            try:
+                return done.pop().result()
+            except Exception as e:
+                print(f"{primary} failed: {e}")
+                return await self.ai_service.complete(secondary, prompt)
+        
+        pending.add(asyncio.create_task(self.ai_service.complete(secondary, prompt)))
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        print(f"Hedged request failed: {e}")
+                        last_error = e
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _merge_partials(self, partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge partial analyses locally when the reduce call fails"""
+        key_points = []
+        for partial in partials:
+            for point in partial.get("key_points", []):
+                if point not in key_points:
+                    key_points.append(point)
+        
+        sentiments = [partial.get("sentiment", "neutral") for partial in partials]
+        sentiment = max(["positive", "negative", "neutral"], key=sentiments.count)
+        
+        return {
+            "analysis": "\n\n".join(partial.get("analysis", "") for partial in partials),
+            "summary": " ".join(partial.get("summary", "") for partial in partials if partial.get("summary")),
+            "key_points": key_points,
+            "sentiment": sentiment
+        }
     
     def _parse_ai_response(self, ai_response: str, analysis_type: str) -> Dict[str, Any]:
         """Parse AI response into structured format"""
@@ -155,3 +328,103 @@ class AnalysisAgent:
             }
         ]
 
+
+class StreamingAnalysis:
+    """Map-reduce analysis whose map calls start as soon as each prompt-sized batch fills up"""
+    
+    def __init__(self, agent: AnalysisAgent, analysis_type: str):
+        self.agent = agent
+        self.analysis_type = analysis_type
+        self.items: List[Dict[str, Any]] = []
+        self.budget = agent.ai_service.prompt_token_budget()
+        self._now = datetime.now(timezone.utc)
+        self._batch: List[Dict[str, Any]] = []
+        self._batch_tokens = 0
+        # Items arriving once only the last batch is left; packed by value at finish
+        self._held: List[Dict[str, Any]] = []
+        self._decisions: List[Dict[str, Any]] = []
+        self._partials: List[asyncio.Task] = []
+        self._semaphore = asyncio.Semaphore(settings.ANALYSIS_MAX_CONCURRENCY)
+    
+    def add(self, items: List[Dict[str, Any]]):
+        """Add items in arrival order, analyzing every batch that can no longer grow"""
+        for item in items:
+            self.items.append(item)
+            if len(self._partials) >= settings.ANALYSIS_MAX_BATCHES - 1:
+                self._held.append(item)
+                continue
+            # Early batches cannot be ranked against items still to come; each item keeps its allowance
+            tokens = min(item_tokens(item), item_allowance(item_value(item, self._now), self.budget))
+            if self._batch and self._batch_tokens + tokens > self.budget:
+                self._launch_batch()
+                if len(self._partials) >= settings.ANALYSIS_MAX_BATCHES - 1:
+                    self._held.append(item)
+                    continue
+            self._batch.append(item)
+            self._batch_tokens += tokens
+    
+    async def finish(self) -> Dict[str, Any]:
+        """Analyze the remaining batch and merge, same result shape as analyze_data"""
+        if not self.items:
+            self.cancel()
+            return await self.agent.analyze_data([], self.analysis_type)
+        
+        try:
+            # What has not been analyzed yet competes by value for the batches left
+            total_budget = self.budget * settings.ANALYSIS_MAX_BATCHES
+            batches, decisions = pack_items(
+                self._batch + self._held, self.budget,
+                max(1, settings.ANALYSIS_MAX_BATCHES - len(self._partials)), self._now
+            )
+            self._decisions.extend(decisions)
+            
+            if not self._partials and len(batches) <= 1:
+                # Everything fit one prompt
+                result = await self.agent._analyze_batch(batches[0], self.analysis_type)
+            else:
+                for batch in batches:
+                    self._launch(batch)
+                partials = await asyncio.gather(*self._partials)
+                result = await self.agent._reduce_partials(list(partials), self.analysis_type)
+            
+            result.update({
+                "data_count": len(self.items),
+                "sources": list(set([item.get("source", "unknown") for item in self.items])),
+                "analysis_type": self.analysis_type,
+                "timestamp": self.agent._get_current_timestamp(),
+                "packing": summarize_decisions(self._decisions, total_budget)
+            })
+            return result
+        
+        except Exception as e:
+            return {
+                "analysis": f"Analysis failed: {str(e)}",
+                "summary": "Unable to analyze data due to technical issues.",
+                "key_points": [],
+                "sentiment": "neutral",
+                "data_count": len(self.items),
+                "error": str(e)
+            }
+    
+    def cancel(self):
+        """Abandon map calls already in flight"""
+        for partial in self._partials:
+            partial.cancel()
+    
+    def _launch_batch(self):
+        """Truncate the open batch's items to their allowances and start analyzing it"""
+        packed = []
+        for item in self._batch:
+            value, tokens = item_value(item, self._now), item_tokens(item)
+            limit = min(tokens, item_allowance(value, self.budget))
+            packed.append(item if limit == tokens else fit_to_tokens(item, limit))
+            self._decisions.append(decision(item, value, tokens, limit))
+        self._launch(packed)
+        self._batch = []
+        self._batch_tokens = 0
+    
+    def _launch(self, batch: List[Dict[str, Any]]):
+        async def analyze() -> Dict[str, Any]:
+            async with self._semaphore:
+                return await self.agent._analyze_batch(batch, self.analysis_type)
+        self._partials.append(asyncio.create_task(analyze()))
@@ -1,5 +1,9 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator
 from ..services.data_sources import data_source_manager
+from ..services.deadline import Deadline
+from ..services.near_duplicates import NearDuplicateFilter
+from ..services.tokens import truncate_to_tokens
+from ..core.config import settings
 
 class DataCollectionAgent:
     """Data Collection Agent - Fetches data from various sources"""
@@ -8,30 +12,50 @@ class DataCollectionAgent:
         self.mcp = mcp
         self.data_source_manager = data_source_manager
     
-    async def collect_data(self, keywords: str, sources: List[str]) -> List[Dict[str, Any]]:
-        """Collect data from specified sources"""
+    async def collect_data(self, keywords: str, sources: List[str],
+                           watermarks: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Collect data from specified sources, only new items when watermarks are given"""
+        cleaned_data = []
+        async for items in self.stream_data(keywords, sources, watermarks, near_duplicates=self.near_duplicate_filter()):
+            cleaned_data.extend(items)
+        return cleaned_data
+    
+    async def stream_data(self, keywords: str, sources: List[str],
+                          watermarks: Optional[Dict[str, Dict[str, Any]]] = None,
+                          deadline: Optional[Deadline] = None,
+                          near_duplicates: Optional[NearDuplicateFilter] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield cleaned items source by source as each one completes, collapsing near-duplicates when given a filter"""
         try:
-            data = await self.data_source_manager.collect_data(keywords, sources)
-            
-            # Filter and clean data
-            cleaned_data = []
-            for item in data:
-                if item.get("title") and item.get("content"):
-                    cleaned_data.append({
-                        "title": item["title"][:200],  # Truncate long titles
-                        "content": item["content"][:1000],  # Truncate long content
-                        "url": item.get("url"),
-                        "source": item.get("source"),
-                        "type": item.get("type"),
-                        "published_at": item.get("published_at"),
-                        "score": item.get("score", 0)
-                    })
-            
-            return cleaned_data
+            async for data in self.data_source_manager.stream_data(keywords, sources, watermarks, deadline):
+                # Filter and clean data
+                cleaned_data = [self._clean_item(item) for item in data if item.get("title") and item.get("content")]
+                if near_duplicates and cleaned_data:
+                    cleaned_data = await near_duplicates.filter(cleaned_data)
+                if cleaned_data:
+                    yield cleaned_data
             
         except Exception as e:
             print(f"Data collection error: {e}")
-            return []
+    
+    def near_duplicate_filter(self, task_id: Optional[int] = None) -> Optional[NearDuplicateFilter]:
+        """Filter for one collection; with a task it also checks the items that task stored recently"""
+        if not settings.NEAR_DUPLICATE_ENABLED:
+            return None
+        return NearDuplicateFilter(task_id, settings.NEAR_DUPLICATE_MAX_DISTANCE, settings.NEAR_DUPLICATE_WINDOW_DAYS)
+    
+    def _clean_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "title": item["title"][:200],  # Truncate long titles
+            # Bounds storage; prompts are truncated further when packed
+            "content": truncate_to_tokens(item["content"], settings.ITEM_CONTENT_MAX_TOKENS),
+            "url": item.get("url"),
+            "source": item.get("source"),
+            "type": item.get("type"),
+            "published_at": item.get("published_at"),
+            "score": item.get("score", 0),
+            "fullname": item.get("fullname"),
+            "watermark_key": item.get("watermark_key")
+        }
     
     async def get_available_sources(self) -> List[Dict[str, Any]]:
         """Get list of available data sources"""
@@ -53,7 +77,6 @@ class DataCollectionAgent:
     async def validate_source_config(self, source_id: str) -> Dict[str, Any]:
         """Validate if a data source is properly configured"""
         if source_id == "news":
-            from ..core.config import settings
             return {
                 "valid": bool(settings.NEWS_API_KEY),
                 "message": "News API key required" if not settings.NEWS_API_KEY else "Ready"
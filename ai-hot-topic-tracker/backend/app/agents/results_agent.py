@@ -1,9 +1,29 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import and_, or_, exists
 from sqlalchemy.orm import Session
-from ..models.task import TaskResult
-from ..core.db import SessionLocal
+from ..models.task import TaskResult, utcnow
+from ..models.item import CollectedItem, TaskResultItem
+from ..core.config import settings
+from ..core.db import run_db
+from ..services.item_store import store_items, link_items, load_result_items
+from ..services.near_duplicates import index_items
+from ..services import rollups
+import base64
 import json
 
+def encode_cursor(created_at: datetime, result_id: int) -> str:
+    """Opaque keyset cursor for the (created_at, id) position of a result"""
+    payload = json.dumps([created_at.isoformat(), result_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, result_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(result_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
 class ResultsAgent:
     """Results Agent - Formats and stores results"""
     
@@ -44,22 +64,33 @@ class ResultsAgent:
     async def store_result(self, task_id: int, raw_data: List[Dict[str, Any]], analysis_result: Dict[str, Any]) -> Dict[str, Any]:
         """Store result in database"""
         try:
-            db = SessionLocal()
-            
-            result = TaskResult(
-                task_id=task_id,
-                raw_data=json.dumps(raw_data),
-                analysis_result=json.dumps(analysis_result)
-            )
+            def insert_result(db: Session) -> int:
+                result = TaskResult(
+                    task_id=task_id,
+                    created_at=utcnow(),
+                    analysis_result=json.dumps(analysis_result),
+                    summary=analysis_result.get("summary", ""),
+                    sentiment=analysis_result.get("sentiment", "neutral"),
+                    data_count=analysis_result.get("data_count", 0),
+                    analysis_type=analysis_result.get("analysis_type"),
+                    partial=bool(analysis_result.get("partial"))
+                )
+                db.add(result)
+                db.flush()
+                
+                # Items are stored once per task and linked to each run that saw them
+                item_ids = store_items(db, task_id, raw_data)
+                link_items(db, result.id, item_ids)
+                if settings.NEAR_DUPLICATE_ENABLED:
+                    index_items(db, task_id, item_ids, settings.NEAR_DUPLICATE_MAX_DISTANCE)
+                rollups.apply_result(db, task_id, result.created_at.date(), analysis_result)
+                return result.id
             
-            db.add(result)
-            db.commit()
-            db.refresh(result)
-            db.close()
+            result_id = await run_db(insert_result)
             
             return {
                 "success": True,
-                "result_id": result.id
+                "result_id": result_id
             }
             
         except Exception as e:
@@ -68,82 +99,140 @@ class ResultsAgent:
                 "error": str(e)
             }
     
+    async def get_result_items(self, result_id: int) -> List[Dict[str, Any]]:
+        """Get the items collected by one run"""
+        return await run_db(load_result_items, result_id)
+    
     async def get_recent_results(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent results across all tasks"""
-        db = SessionLocal()
-        
-        results = (
-            db.query(TaskResult)
-            .order_by(TaskResult.created_at.desc())
-            .limit(limit)
-            .all()
-        )
+        page = await self.list_results(limit=limit)
+        return page["results"]
+    
+    async def list_results(
+        self,
+        task_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        sentiment: Optional[str] = None,
+        source: Optional[str] = None,
+        analysis_type: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        include_analysis: bool = False
+    ) -> Dict[str, Any]:
+        """Page through results newest first using a (created_at, id) keyset cursor"""
+        page_size = max(1, min(limit or settings.RESULTS_PAGE_SIZE, settings.RESULTS_MAX_PAGE_SIZE))
+        after = decode_cursor(cursor) if cursor else None
         
-        formatted_results = []
-        for result in results:
-            try:
-                analysis_data = json.loads(result.analysis_result)
-                formatted_results.append({
-                    "id": result.id,
-                    "task_id": result.task_id,
-                    "summary": analysis_data.get("summary", ""),
-                    "sentiment": analysis_data.get("sentiment", "neutral"),
-                    "data_count": analysis_data.get("data_count", 0),
-                    "created_at": result.created_at.isoformat()
-                })
-            except json.JSONDecodeError:
-                continue
+        def query_page(db: Session) -> Dict[str, Any]:
+            # Only the summary columns; no JSON blobs are read unless asked for
+            columns = [
+                TaskResult.id,
+                TaskResult.task_id,
+                TaskResult.summary,
+                TaskResult.sentiment,
+                TaskResult.data_count,
+                TaskResult.partial,
+                TaskResult.created_at
+            ]
+            if include_analysis:
+                columns.append(TaskResult.analysis_result)
+            query = db.query(*columns)
+            
+            if task_id is not None:
+                query = query.filter(TaskResult.task_id == task_id)
+            if sentiment:
+                query = query.filter(TaskResult.sentiment == sentiment)
+            if analysis_type:
+                query = query.filter(TaskResult.analysis_type == analysis_type)
+            if since:
+                query = query.filter(TaskResult.created_at >= since)
+            if until:
+                query = query.filter(TaskResult.created_at < until)
+            if source:
+                query = query.filter(exists().where(
+                    TaskResultItem.result_id == TaskResult.id,
+                    TaskResultItem.item_id == CollectedItem.id,
+                    # Task source ids ("news", "reddit") match the item type; outlet names and r/<sub> the source
+                    or_(CollectedItem.source == source, CollectedItem.type == source)
+                ))
+            if after:
+                created_at, result_id = after
+                query = query.filter(or_(
+                    TaskResult.created_at < created_at,
+                    and_(TaskResult.created_at == created_at, TaskResult.id < result_id)
+                ))
+            
+            rows = (
+                query.order_by(TaskResult.created_at.desc(), TaskResult.id.desc())
+                .limit(page_size + 1)
+                .all()
+            )
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            
+            results = []
+            for row in rows:
+                if include_analysis:
+                    results.append({
+                        "id": row.id,
+                        "task_id": row.task_id,
+                        "analysis_result": json.loads(row.analysis_result),
+                        "created_at": row.created_at.isoformat()
+                    })
+                else:
+                    results.append({
+                        "id": row.id,
+                        "task_id": row.task_id,
+                        "summary": row.summary or "",
+                        "sentiment": row.sentiment or "neutral",
+                        "data_count": row.data_count or 0,
+                        "partial": bool(row.partial),
+                        "created_at": row.created_at.isoformat()
+                    })
+            
+            return {
+                "results": results,
+                "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+            }
         
-        db.close()
-        return formatted_results
+        return await run_db(query_page)
     
     async def get_task_history(self, task_id: int, limit: int = 20) -> List[Dict[str, Any]]:
         """Get historical results for a specific task"""
-        db = SessionLocal()
-        
-        results = (
-            db.query(TaskResult)
-            .filter(TaskResult.task_id == task_id)
-            .order_by(TaskResult.created_at.desc())
-            .limit(limit)
-            .all()
-        )
-        
-        history = []
-        for result in results:
-            try:
-                analysis_data = json.loads(result.analysis_result)
-                history.append({
-                    "id": result.id,
-                    "analysis": analysis_data,
-                    "created_at": result.created_at.isoformat()
-                })
-            except json.JSONDecodeError:
-                continue
+        def query_history(db: Session) -> List[Dict[str, Any]]:
+            results = (
+                db.query(TaskResult.id, TaskResult.analysis_result, TaskResult.created_at)
+                .filter(TaskResult.task_id == task_id)
+                .order_by(TaskResult.created_at.desc())
+                .limit(limit)
+                .all()
+            )
+            
+            history = []
+            for result in results:
+                try:
+                    analysis_data = json.loads(result.analysis_result)
+                    history.append({
+                        "id": result.id,
+                        "analysis": analysis_data,
+                        "created_at": result.created_at.isoformat()
+                    })
+                except json.JSONDecodeError:
+                    continue
+            return history
         
-        db.close()
-        return history
+        return await run_db(query_history)
     
     async def generate_summary_report(self, task_id: int, days: int = 7) -> Dict[str, Any]:
-        """Generate a summary report for a task over specified days"""
-        from datetime import datetime, timedelta
+        """Generate a summary report for a task over the last N (UTC) days from its daily rollups"""
+        from datetime import timedelta
         
-        db = SessionLocal()
+        since_day = utcnow().date() - timedelta(days=max(days, 1) - 1)
+        rows = await run_db(rollups.load_rollups, task_id, since_day)
+        total_runs = sum(row["runs"] for row in rows)
         
-        # Get results from the last N days
-        since_date = datetime.now() - timedelta(days=days)
-        results = (
-            db.query(TaskResult)
-            .filter(
-                TaskResult.task_id == task_id,
-                TaskResult.created_at >= since_date
-            )
-            .order_by(TaskResult.created_at.desc())
-            .all()
-        )
-        
-        if not results:
-            db.close()
+        if not total_runs:
             return {
                 "task_id": task_id,
                 "period": f"Last {days} days",
@@ -151,44 +240,25 @@ class ResultsAgent:
                 "summary": "No data available for this period"
             }
         
-        # Analyze trends
-        sentiments = []
-        data_counts = []
-        key_topics = {}
-        
-        for result in results:
-            try:
-                analysis_data = json.loads(result.analysis_result)
-                sentiments.append(analysis_data.get("sentiment", "neutral"))
-                data_counts.append(analysis_data.get("data_count", 0))
-                
-                # Collect key points
-                for point in analysis_data.get("key_points", []):
-                    key_topics[point] = key_topics.get(point, 0) + 1
-                    
-            except json.JSONDecodeError:
-                continue
-        
-        # Calculate summary statistics
-        avg_data_count = sum(data_counts) / len(data_counts) if data_counts else 0
+        # Combine the per-day counters
         sentiment_counts = {
-            "positive": sentiments.count("positive"),
-            "negative": sentiments.count("negative"),
-            "neutral": sentiments.count("neutral")
+            "positive": sum(row["positive"] for row in rows),
+            "negative": sum(row["negative"] for row in rows),
+            "neutral": sum(row["neutral"] for row in rows)
         }
+        top_topics = await run_db(rollups.load_top_topics, task_id, since_day, 5)
         
+        # Calculate summary statistics
+        avg_data_count = sum(row["data_count_sum"] for row in rows) / total_runs
         dominant_sentiment = max(sentiment_counts, key=sentiment_counts.get)
-        top_topics = sorted(key_topics.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        db.close()
         
         return {
             "task_id": task_id,
             "period": f"Last {days} days",
-            "total_runs": len(results),
+            "total_runs": total_runs,
             "avg_data_per_run": round(avg_data_count, 1),
             "sentiment_distribution": sentiment_counts,
             "dominant_sentiment": dominant_sentiment,
-            "top_topics": [topic for topic, count in top_topics],
-            "summary": f"Analyzed {len(results)} data collections with an average of {round(avg_data_count, 1)} items per run. Overall sentiment: {dominant_sentiment}."
+            "top_topics": top_topics,
+            "summary": f"Analyzed {total_runs} data collections with an average of {round(avg_data_count, 1)} items per run. Overall sentiment: {dominant_sentiment}."
         }
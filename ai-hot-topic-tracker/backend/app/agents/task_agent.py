@@ -1,53 +1,186 @@
-from typing import Dict, Any, List
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.triggers.interval import IntervalTrigger
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
 import json
 import asyncio
-from ..models.task import Task, TaskResult
-from ..core.db import SessionLocal
+import random
+from ..models.task import Task
+from ..core.config import settings
+from ..core.db import run_db
+from ..services.watermarks import load_watermarks, advance_watermarks
+from ..services.item_store import item_fingerprint
+from ..services.analysis_history import load_analysis_state, load_recent_items
+from ..services.broadcaster import task_topic, keyword_topic
+from ..services.leader import LeaderLease
+from ..services.run_queue import enqueue_run, list_runs, get_run
+from ..services.deadline import Deadline
+from ..services.near_duplicates import NearDuplicateFilter
+from ..services.adaptive_schedule import interval_bounds, current_interval, count_new_items, record_novelty, load_interval
+
+# Called with each pipeline stage as a run reaches it
+Progress = Callable[[str], Awaitable[None]]
+
+# The running TaskAgent; persisted jobs call run_scheduled_task by name
+_task_agent: Optional["TaskAgent"] = None
+
+async def run_scheduled_task(task_id: int):
+    """Scheduler entry point for persisted task jobs"""
+    if _task_agent is None:
+        print(f"Task agent not running, skipping task {task_id}")
+        return
+    await _task_agent._execute_task(task_id)
 
 class TaskAgent:
     """Task Management Agent - Manages task lifecycle and scheduling"""
     
     def __init__(self, mcp):
         self.mcp = mcp
-        self.scheduler = AsyncIOScheduler()
-        self.scheduler.start()
+        self.scheduler = AsyncIOScheduler(
+            jobstores={
+                "default": SQLAlchemyJobStore(url=settings.SCHEDULER_JOBSTORE_URL or settings.DATABASE_URL)
+            },
+            job_defaults={
+                "coalesce": True,
+                "max_instances": 1,
+                "misfire_grace_time": settings.SCHEDULER_MISFIRE_GRACE_SECONDS
+            }
+        )
+        
+        # Only the process holding this lease runs scheduled jobs
+        self.lease = LeaderLease("scheduler", settings.SCHEDULER_LEASE_SECONDS)
+        self._leadership: Optional[asyncio.Task] = None
+        
+        # Global and per-source limits on concurrently executing runs
+        self._run_slots = asyncio.Semaphore(settings.SCHEDULER_MAX_CONCURRENT_RUNS)
+        self._source_slots: Dict[str, asyncio.Semaphore] = {}
+    
+    async def start(self):
+        """Start the scheduler paused and compete for the lease that lets it run jobs"""
+        global _task_agent
+        _task_agent = self
+        # Every process keeps a scheduler so it can add and remove jobs in the shared
+        # job store, but only the lease holder resumes it and runs them
+        self.scheduler.start(paused=True)
+        await self._update_leadership()
+        if not self.lease.is_leader:
+            print("Scheduler standing by, lease held by another process")
+        self._leadership = asyncio.create_task(self._keep_leadership())
+    
+    async def shutdown(self):
+        """Stop the scheduler without waiting for running jobs and hand the lease on"""
+        if self._leadership:
+            self._leadership.cancel()
+            await asyncio.gather(self._leadership, return_exceptions=True)
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        await self.lease.release()
+    
+    async def _keep_leadership(self):
+        while True:
+            await asyncio.sleep(settings.SCHEDULER_LEASE_RENEW_SECONDS)
+            await self._update_leadership()
+    
+    async def _update_leadership(self):
+        """Renew the lease, resuming or pausing the scheduler when leadership changes"""
+        was_leader = self.lease.is_leader
+        is_leader = await self.lease.renew()
+        if is_leader and not was_leader:
+            await self._reconcile_jobs()
+            self.scheduler.resume()
+            print(f"Scheduler lease acquired by {self.lease.holder}")
+        elif was_leader and not is_leader:
+            self.scheduler.pause()
+            print(f"Scheduler lease lost by {self.lease.holder}, pausing")
+        elif is_leader:
+            # Pick up jobs that other processes added to the shared job store
+            self.scheduler.wakeup()
+    
+    async def _reconcile_jobs(self):
+        """Re-register every active task and drop jobs of tasks that are gone"""
+        tasks = await run_db(self._load_schedules)
+        active_job_ids = set()
+        for task in tasks:
+            job_id = f"task_{task['id']}"
+            active_job_ids.add(job_id)
+            # Keep the persisted next run time of jobs that survived the restart
+            if self.scheduler.get_job(job_id) is None:
+                self._schedule_task(task["id"], task["schedule_interval"])
+        
+        for job in self.scheduler.get_jobs():
+            if job.id.startswith("task_") and job.id not in active_job_ids:
+                job.remove()
+        
+        print(f"Scheduler started with {len(tasks)} active tasks")
+    
+    def _schedule_task(self, task_id: int, interval: int):
+        """Add the interval job for a task with a staggered first run and jitter"""
+        stagger = random.uniform(0, min(interval, settings.SCHEDULER_STAGGER_SECONDS))
+        self.scheduler.add_job(
+            "app.agents.task_agent:run_scheduled_task",
+            trigger=IntervalTrigger(
+                seconds=interval,
+                start_date=datetime.now(timezone.utc) + timedelta(seconds=stagger),
+                jitter=settings.SCHEDULER_JITTER_SECONDS
+            ),
+            args=[task_id],
+            id=f"task_{task_id}",
+            replace_existing=True
+        )
+    
+    async def _sync_interval(self, task_id: int):
+        """Reschedule a task whose adaptive interval moved since its job was scheduled"""
+        try:
+            interval = await run_db(load_interval, task_id)
+            job = self.scheduler.get_job(f"task_{task_id}")
+            if interval is None or job is None or job.trigger.interval.total_seconds() == interval:
+                return
+            # The next run is an interval from now; the run that moved it has just finished
+            job.reschedule(IntervalTrigger(seconds=interval, jitter=settings.SCHEDULER_JITTER_SECONDS))
+            print(f"Task {task_id} now runs every {interval}s")
+        except Exception as e:
+            print(f"Error rescheduling task {task_id}: {e}")
+    
+    def _load_schedules(self, db: Session) -> List[Dict[str, Any]]:
+        tasks = db.query(Task).filter(Task.is_active == True).all()
+        return [{"id": task.id, "schedule_interval": current_interval(task)} for task in tasks]
     
     async def create_task(self, task_config: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new tracking task"""
         try:
-            db = SessionLocal()
+            def insert_task(db: Session) -> Dict[str, Any]:
+                task = Task(
+                    name=f"Track: {task_config['keywords']}",
+                    keywords=task_config["keywords"],
+                    sources=json.dumps(task_config["sources"]),
+                    analysis_type=task_config.get("analysis_type", "summary"),
+                    schedule_interval=task_config.get("schedule_interval", 3600),
+                    run_timeout=task_config.get("run_timeout"),
+                    adaptive_schedule=task_config.get("adaptive_schedule", settings.ADAPTIVE_SCHEDULE_DEFAULT),
+                    min_interval=task_config.get("min_interval"),
+                    max_interval=task_config.get("max_interval"),
+                    is_active=True
+                )
+                if task.adaptive_schedule:
+                    # Start from the requested interval, within the bounds
+                    low, high = interval_bounds(task)
+                    task.effective_interval = min(max(task.schedule_interval, low), high)
+                db.add(task)
+                db.flush()
+                return {"id": task.id, "schedule_interval": current_interval(task)}
             
             # Create task record
-            task = Task(
-                name=f"Track: {task_config['keywords']}",
-                keywords=task_config["keywords"],
-                sources=json.dumps(task_config["sources"]),
-                analysis_type=task_config.get("analysis_type", "summary"),
-                schedule_interval=task_config.get("schedule_interval", 3600),
-                is_active=True
-            )
-            
-            db.add(task)
-            db.commit()
-            db.refresh(task)
+            task = await run_db(insert_task)
             
             # Schedule the task
-            self.scheduler.add_job(
-                self._execute_task,
-                trigger=IntervalTrigger(seconds=task.schedule_interval),
-                args=[task.id],
-                id=f"task_{task.id}",
-                replace_existing=True
-            )
-            
-            db.close()
+            self._schedule_task(task["id"], task["schedule_interval"])
             
             return {
                 "success": True,
-                "task_id": task.id,
+                "task_id": task["id"],
                 "message": f"Task created and scheduled"
             }
             
@@ -59,32 +192,43 @@ class TaskAgent:
     
     async def list_tasks(self) -> List[Dict[str, Any]]:
         """List all active tasks"""
-        db = SessionLocal()
-        tasks = db.query(Task).filter(Task.is_active == True).all()
+        def query_tasks(db: Session) -> List[Dict[str, Any]]:
+            tasks = db.query(Task).filter(Task.is_active == True).all()
+            
+            result = []
+            for task in tasks:
+                result.append({
+                    "id": task.id,
+                    "name": task.name,
+                    "keywords": task.keywords,
+                    "sources": json.loads(task.sources),
+                    "analysis_type": task.analysis_type,
+                    "schedule_interval": task.schedule_interval,
+                    "effective_interval": current_interval(task),
+                    "adaptive_schedule": bool(task.adaptive_schedule),
+                    "min_interval": interval_bounds(task)[0] if task.adaptive_schedule else None,
+                    "max_interval": interval_bounds(task)[1] if task.adaptive_schedule else None,
+                    "novel_items": task.novel_items,
+                    "run_timeout": task.run_timeout or settings.RUN_TIMEOUT_SECONDS,
+                    "created_at": task.created_at.isoformat()
+                })
+            return result
         
-        result = []
-        for task in tasks:
-            result.append({
-                "id": task.id,
-                "name": task.name,
-                "keywords": task.keywords,
-                "sources": json.loads(task.sources),
-                "analysis_type": task.analysis_type,
-                "schedule_interval": task.schedule_interval,
-                "created_at": task.created_at.isoformat()
-            })
-        
-        db.close()
-        return result
+        return await run_db(query_tasks)
     
     async def delete_task(self, task_id: int) -> Dict[str, Any]:
         """Delete a task"""
         try:
-            db = SessionLocal()
-            task = db.query(Task).filter(Task.id == task_id).first()
+            def deactivate_task(db: Session) -> bool:
+                task = db.query(Task).filter(Task.id == task_id).first()
+                if not task:
+                    return False
+                
+                # Mark as inactive
+                task.is_active = False
+                return True
             
-            if not task:
-                db.close()
+            if not await run_db(deactivate_task):
                 return {
                     "success": False,
                     "error": "Task not found"
@@ -96,11 +240,6 @@ class TaskAgent:
             except:
                 pass  # Job might not exist
             
-            # Mark as inactive
-            task.is_active = False
-            db.commit()
-            db.close()
-            
             return {
                 "success": True,
                 "message": f"Task {task_id} deleted"
@@ -113,66 +252,232 @@ class TaskAgent:
             }
     
     async def _execute_task(self, task_id: int):
-        """Execute a scheduled task"""
+        """Run a scheduled task here, or queue it for a pipeline worker"""
         try:
-            db = SessionLocal()
-            task = db.query(Task).filter(Task.id == task_id, Task.is_active == True).first()
-            
-            if not task:
-                db.close()
-                return
-            
-            # Collect data via MCP
-            sources = json.loads(task.sources)
-            raw_data = await self.mcp.collect_data(task.keywords, sources)
-            
-            if raw_data:
-                # Analyze data via MCP
-                analysis_result = await self.mcp.analyze_data(raw_data, task.analysis_type)
-                
-                # Store result
-                result = TaskResult(
-                    task_id=task.id,
-                    raw_data=json.dumps(raw_data),
-                    analysis_result=json.dumps(analysis_result)
-                )
-                
-                db.add(result)
-                db.commit()
-                
-                # Notify frontend via MCP
-                await self.mcp.notify_frontend({
-                    "type": "task_result",
-                    "task_id": task.id,
-                    "task_name": task.name,
-                    "result": analysis_result
-                })
-            
-            db.close()
-            
+            if settings.PIPELINE_MODE == "queue":
+                await run_db(enqueue_run, task_id)
+            else:
+                await self.execute_run(task_id)
         except Exception as e:
             print(f"Error executing task {task_id}: {e}")
+        # Queued runs move the interval when a worker finishes them, so this applies
+        # the previous run's novelty; inline runs apply their own
+        await self._sync_interval(task_id)
+    
+    async def execute_run(self, task_id: int, progress: Optional[Progress] = None) -> Optional[Dict[str, Any]]:
+        """Execute one run of a task within the global and per-source concurrency limits"""
+        task = await run_db(self._load_active_task, task_id)
+        if not task:
+            return None
+        
+        # The budget covers waiting for a slot, so a run never occupies the scheduler longer
+        deadline = Deadline(task["run_timeout"] or settings.RUN_TIMEOUT_SECONDS)
+        try:
+            # Stages stop themselves within the deadline; this bounds anything that does not
+            async with asyncio.timeout(deadline.remaining() + settings.RUN_DEADLINE_GRACE_SECONDS):
+                async with AsyncExitStack() as stack:
+                    await stack.enter_async_context(self._run_slots)
+                    # Acquire in a fixed order so runs sharing sources cannot deadlock
+                    for source in sorted(set(task["sources"])):
+                        await stack.enter_async_context(self._source_slot(source))
+                    return await self._run_task(task, progress, deadline)
+        except TimeoutError:
+            raise Exception(f"Run of task {task_id} exceeded its deadline")
+    
+    async def list_runs(self, task_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """Recent queued, running and finished runs of a task"""
+        return await run_db(list_runs, task_id, limit)
+    
+    async def get_run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        return await run_db(get_run, run_id)
+    
+    def _source_slot(self, source: str) -> asyncio.Semaphore:
+        if source not in self._source_slots:
+            self._source_slots[source] = asyncio.Semaphore(settings.SCHEDULER_MAX_RUNS_PER_SOURCE)
+        return self._source_slots[source]
+    
+    async def _run_task(self, task: Dict[str, Any], progress: Optional[Progress] = None,
+                        deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Collect, analyze, store and notify for one task run"""
+        if deadline is None:
+            deadline = Deadline(task.get("run_timeout") or settings.RUN_TIMEOUT_SECONDS)
+        
+        async def report(stage: str):
+            if progress:
+                await progress(stage)
+        
+        # Collect only items newer than what earlier runs already stored
+        await report("collecting")
+        watermarks = await run_db(load_watermarks, task["id"])
+        near_duplicates = self.mcp.data_collection_agent.near_duplicate_filter(task["id"])
+        raw_data, analysis_result = await self._collect_and_analyze(task, watermarks, report, deadline, near_duplicates)
+        # Collapsed near-duplicates still move their source's watermark
+        collected = near_duplicates.collected if near_duplicates else raw_data
+        novel_items = await run_db(count_new_items, task["id"], raw_data) if raw_data else 0
+        outcome = {"data_count": len(raw_data), "novel_items": novel_items, "result_id": None}
+        
+        stored = {"success": True}
+        if raw_data:
+            if near_duplicates:
+                analysis_result["duplicates_collapsed"] = near_duplicates.collapsed
+            # Store result
+            await report("storing")
+            stored = await self.mcp.results_agent.store_result(task["id"], raw_data, analysis_result)
+            if stored["success"]:
+                outcome["result_id"] = stored["result_id"]
+            else:
+                print(f"Error storing result for task {task['id']}: {stored['error']}")
+                outcome["error"] = stored["error"]
+        
+        if stored["success"] and collected:
+            await run_db(advance_watermarks, task["id"], collected)
+            if near_duplicates:
+                await near_duplicates.commit()
+        
+        if raw_data:
+            # Notify frontend via MCP
+            await report("notifying")
+            await self.mcp.notify_frontend({
+                "type": "task_result",
+                "task_id": task["id"],
+                "task_name": task["name"],
+                "result": analysis_result
+            }, topics=[task_topic(task["id"]), keyword_topic(task["keywords"])])
+        
+        outcome["interval"] = await run_db(record_novelty, task["id"], novel_items, bool(deadline.cut_short))
+        return outcome
+    
+    async def _collect_and_analyze(self, task: Dict[str, Any], watermarks: Dict[str, Dict[str, Any]],
+                                   report: Progress, deadline: Deadline,
+                                   near_duplicates: Optional[NearDuplicateFilter] = None
+                                   ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Consume collection source by source, deduplicating as items arrive; when the run needs a
+        full analysis anyway, batches are analyzed while slower sources are still being fetched"""
+        analysis_type = task["analysis_type"]
+        streaming = None
+        state = await run_db(load_analysis_state, task["id"], [])
+        if self.mcp.analysis_agent.needs_full_refresh(analysis_type, state["previous"], []):
+            streaming = self.mcp.analysis_agent.start_streaming(analysis_type)
+        
+        raw_data = []
+        fingerprints = set()
+        try:
+            collect_deadline = deadline.stage(settings.RUN_COLLECT_SHARE, reserve=settings.RUN_STORE_RESERVE_SECONDS)
+            async for items in self.mcp.stream_data(task["keywords"], task["sources"], watermarks, collect_deadline,
+                                                    near_duplicates):
+                # The same link can arrive from several sources
+                fresh = []
+                for item in items:
+                    fingerprint = item_fingerprint(item)
+                    if fingerprint not in fingerprints:
+                        fingerprints.add(fingerprint)
+                        fresh.append(item)
+                raw_data.extend(fresh)
+                if streaming:
+                    streaming.add(fresh)
+        except BaseException:
+            if streaming:
+                streaming.cancel()
+            raise
+        
+        if not raw_data:
+            if streaming:
+                streaming.cancel()
+            return raw_data, None
+        
+        history = []
+        if streaming and analysis_type in settings.INCREMENTAL_ANALYSIS_TYPES:
+            # Stored items fill the window only once the run has found something, behind the new items
+            history = await run_db(
+                load_recent_items, task["id"], list(fingerprints),
+                max(0, settings.INCREMENTAL_WINDOW_ITEMS - len(raw_data))
+            )
+            for item in history:
+                item["novel"] = False
+            streaming.add(history)
+        
+        # Analyze data via MCP, within what is left of the budget after keeping time to store
+        await report("analyzing")
+        try:
+            async with asyncio.timeout(deadline.timeout(reserve=settings.RUN_STORE_RESERVE_SECONDS)):
+                if streaming is None:
+                    analysis_result = await self._analyze_run(task, raw_data)
+                else:
+                    analysis_result = await streaming.finish()
+                    if analysis_type in settings.INCREMENTAL_ANALYSIS_TYPES:
+                        seen = (await run_db(load_analysis_state, task["id"], list(fingerprints)))["seen"]
+                        analysis_result.update({
+                            "data_count": len(raw_data),
+                            "new_items": len(fingerprints - seen),
+                            "window_count": len(raw_data) + len(history),
+                            "analysis_mode": "full",
+                            "incremental_runs": 0
+                        })
+        except TimeoutError:
+            if streaming:
+                streaming.cancel()
+            print(f"Analysis of task {task['id']} ran out of time, using basic analysis")
+            deadline.note("analysis_timeout")
+            analysis_result = self.mcp.analysis_agent.fallback_analysis(raw_data, analysis_type)
+        
+        if deadline.cut_short:
+            analysis_result["partial"] = True
+            analysis_result["partial_reasons"] = list(deadline.cut_short)
+        return raw_data, analysis_result
+    
+    async def _analyze_run(self, task: Dict[str, Any], raw_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Update the previous analysis with the new items, or re-analyze the recent window"""
+        analysis_type = task["analysis_type"]
+        fingerprints = [item_fingerprint(item) for item in raw_data]
+        state = await run_db(load_analysis_state, task["id"], fingerprints)
+        new_items = []
+        for item, fingerprint in zip(raw_data, fingerprints):
+            # Prompt packing ranks items earlier analyses have not covered higher
+            item["novel"] = fingerprint not in state["seen"]
+            if item["novel"]:
+                new_items.append(item)
+        
+        if not self.mcp.analysis_agent.needs_full_refresh(analysis_type, state["previous"], new_items):
+            try:
+                return await self.mcp.update_analysis(raw_data, new_items, state["previous"], analysis_type)
+            except Exception as e:
+                print(f"Incremental analysis failed for task {task['id']}, re-analyzing: {e}")
+        
+        if analysis_type not in settings.INCREMENTAL_ANALYSIS_TYPES:
+            return await self.mcp.analyze_data(raw_data, analysis_type)
+        
+        # Full refresh over this run's items plus the most recent stored ones
+        history = await run_db(
+            load_recent_items, task["id"], fingerprints,
+            max(0, settings.INCREMENTAL_WINDOW_ITEMS - len(raw_data))
+        )
+        for item in history:
+            item["novel"] = False
+        window = raw_data + history
+        analysis_result = await self.mcp.analyze_data(window, analysis_type)
+        analysis_result.update({
+            "data_count": len(raw_data),
+            "new_items": len(new_items),
+            "window_count": len(window),
+            "analysis_mode": "full",
+            "incremental_runs": 0
+        })
+        return analysis_result
+    
+    def _load_active_task(self, db: Session, task_id: int) -> Optional[Dict[str, Any]]:
+        task = db.query(Task).filter(Task.id == task_id, Task.is_active == True).first()
+        if not task:
+            return None
+        return {
+            "id": task.id,
+            "name": task.name,
+            "keywords": task.keywords,
+            "sources": json.loads(task.sources),
+            "analysis_type": task.analysis_type,
+            "run_timeout": task.run_timeout
+        }
     
     async def get_task_results(self, task_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent results for a task"""
-        db = SessionLocal()
-        results = (
-            db.query(TaskResult)
-            .filter(TaskResult.task_id == task_id)
-            .order_by(TaskResult.created_at.desc())
-            .limit(limit)
-            .all()
-        )
-        
-        result_list = []
-        for result in results:
-            result_list.append({
-                "id": result.id,
-                "task_id": result.task_id,
-                "analysis_result": json.loads(result.analysis_result),
-                "created_at": result.created_at.isoformat()
-            })
-        
-        db.close()
-        return result_list
-
+        page = await self.mcp.results_agent.list_results(task_id=task_id, limit=limit, include_analysis=True)
+        return page["results"]
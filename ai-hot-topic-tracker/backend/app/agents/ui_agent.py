@@ -1,14 +1,29 @@
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator
 import json
+from ..services.ai_service import ai_service
+
+CHAT_SYSTEM_PROMPT = (
+    "You are the assistant of AI Hot Topic Tracker, an app that tracks topics across news and Reddit "
+    "and analyzes them with AI. Answer briefly. Users can say 'track <keywords>' to create a task, "
+    "'list tasks' to see their tasks, 'delete task <id>' to remove one, and 'help' for all commands."
+)
 
 class UIAgent:
     """User Interface Agent - Handles communication with the frontend"""
     
     def __init__(self, mcp):
         self.mcp = mcp
+        self.ai_service = ai_service
     
     async def process_user_message(self, message: str) -> Dict[str, Any]:
         """Process user message and return appropriate response"""
+        if not self._is_command(message):
+            reply = "".join([token async for token in self._stream_chat_reply(message)])
+            return {
+                "type": "response",
+                "message": reply
+            }
+        
         message = message.strip().lower()
         
         # Parse user intent
@@ -18,13 +33,52 @@ class UIAgent:
             return await self._handle_list_tasks()
         elif "delete task" in message or "remove task" in message:
             return await self._handle_delete_task(message)
-        elif "help" in message:
-            return self._handle_help()
         else:
-            return {
+            return self._handle_help()
+    
+    async def stream_user_message(self, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """Process user message, yielding content events as soon as text is available"""
+        if self._is_command(message):
+            result = await self.process_user_message(message)
+            yield {"type": "content", "content": result["message"]}
+            yield {"type": "done", "result": result}
+            return
+        
+        reply = []
+        async for token in self._stream_chat_reply(message):
+            reply.append(token)
+            yield {"type": "content", "content": token}
+        
+        yield {
+            "type": "done",
+            "result": {
                 "type": "response",
-                "message": "I didn't understand that. Type 'help' to see what I can do."
+                "message": "".join(reply)
             }
+        }
+    
+    def _is_command(self, message: str) -> bool:
+        """Check whether the message matches one of the supported commands"""
+        message = message.strip().lower()
+        commands = ("create task", "track", "list tasks", "show tasks", "delete task", "remove task", "help")
+        return any(command in message for command in commands)
+    
+    async def _stream_chat_reply(self, message: str) -> AsyncIterator[str]:
+        """Stream a free-form reply from the AI provider, or explain the commands without one"""
+        messages = [
+            {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+            {"role": "user", "content": message.strip()}
+        ]
+        started = False
+        try:
+            async for token in self.ai_service.stream_chat(messages):
+                started = True
+                yield token
+        except Exception as e:
+            if started:
+                raise
+            print(f"Chat reply failed: {e}")
+            yield "I didn't understand that. Type 'help' to see what I can do."
     
     async def _handle_create_task(self, message: str) -> Dict[str, Any]:
         """Handle task creation requests"""
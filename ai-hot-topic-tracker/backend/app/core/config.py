@@ -5,16 +5,142 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./ai_tracker.db"
+    DB_EXECUTOR_WORKERS: int = 8  # keep within the engine's connection pool size
     
     # API Keys
     OPENAI_API_KEY: Optional[str] = None
     DEEPSEEK_API_KEY: Optional[str] = None
     NEWS_API_KEY: Optional[str] = None
     
+    # AI Models
+    OPENAI_MODEL: str = "gpt-3.5-turbo"
+    DEEPSEEK_MODEL: str = "deepseek-chat"
+    LLM_MAX_TOKENS: int = 1000
+    LLM_REQUEST_TIMEOUT: float = 60.0  # in seconds, per completion request
+    
+    # Map-reduce analysis of large item sets
+    ANALYSIS_PROMPT_TOKEN_BUDGET: int = 3000  # per batch prompt content, for models not listed below
+    ANALYSIS_MODEL_TOKEN_BUDGETS: dict = {"gpt-3.5-turbo": 3000, "deepseek-chat": 6000}
+    ANALYSIS_MAX_CONCURRENCY: int = 4
+    ANALYSIS_MAX_BATCHES: int = 4  # requests per analysis; the least valuable items beyond are dropped
+    
+    # Prompt packing: items ranked by value fill the budget, each truncated by its value when they don't all fit
+    PROMPT_RANK_WEIGHTS: dict = {"score": 0.4, "recency": 0.3, "novelty": 0.3}
+    PROMPT_SCORE_SATURATION: int = 1000  # Reddit score that counts as fully popular
+    PROMPT_RECENCY_HALF_LIFE_HOURS: float = 24.0
+    PROMPT_ITEM_MIN_TOKENS: int = 40  # items that cannot keep this many tokens are left out
+    PROMPT_ITEM_MAX_SHARE: float = 0.25  # of a request's budget, kept by the most valuable item
+    ITEM_CONTENT_MAX_TOKENS: int = 1000  # content kept per collected item
+    
+    # Provider circuit breakers and hedged requests
+    CIRCUIT_BREAKER_WINDOW_SECONDS: float = 300.0
+    CIRCUIT_BREAKER_MIN_REQUESTS: int = 5
+    CIRCUIT_BREAKER_ERROR_RATE: float = 0.5
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS: float = 30.0  # p95 latency that trips the breaker
+    CIRCUIT_BREAKER_OPEN_SECONDS: float = 60.0
+    ANALYSIS_HEDGING_ENABLED: bool = False
+    ANALYSIS_HEDGE_DEFAULT_DELAY: float = 10.0  # used until the primary has latency samples
+    ANALYSIS_HEDGE_MIN_DELAY: float = 1.0
+    
+    # LLM completion cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = "./llm_cache.db"
+    LLM_CACHE_TTL: int = 6 * 3600  # in seconds
+    LLM_CACHE_MAX_ENTRIES: int = 512
+    LLM_CACHE_MAX_PERSISTENT_ENTRIES: int = 10000
+    
     # App Settings
     APP_NAME: str = "AI Hot Topic Tracker"
     DEBUG: bool = False
     
+    # Task scheduler
+    SCHEDULER_JOBSTORE_URL: Optional[str] = None  # defaults to DATABASE_URL
+    SCHEDULER_MAX_CONCURRENT_RUNS: int = 8
+    SCHEDULER_MAX_RUNS_PER_SOURCE: int = 4
+    SCHEDULER_JITTER_SECONDS: int = 60
+    SCHEDULER_STAGGER_SECONDS: int = 300  # spread of first runs after create/restart
+    SCHEDULER_MISFIRE_GRACE_SECONDS: int = 300
+    SCHEDULER_LEASE_SECONDS: float = 30.0  # a dead leader is replaced after at most this long
+    SCHEDULER_LEASE_RENEW_SECONDS: float = 10.0
+    
+    # Adaptive intervals: back off while a topic is quiet, speed up while it bursts
+    ADAPTIVE_SCHEDULE_DEFAULT: bool = False  # for tasks created without adaptive_schedule
+    ADAPTIVE_MIN_INTERVAL: int = 300  # in seconds, default lower bound per task
+    ADAPTIVE_MAX_INTERVAL: int = 86400  # default upper bound per task
+    ADAPTIVE_BACKOFF_FACTOR: float = 2.0  # interval growth per run without novel items
+    ADAPTIVE_SPEEDUP_FACTOR: float = 2.0  # interval shrink per bursting run
+    ADAPTIVE_BURST_RATE: float = 10.0  # novel items per hour that count as a burst
+    
+    # Run deadlines: collection gets a share of the budget, storage keeps a reserve
+    RUN_TIMEOUT_SECONDS: int = 600  # default for tasks without run_timeout
+    RUN_COLLECT_SHARE: float = 0.5
+    RUN_STORE_RESERVE_SECONDS: float = 10.0
+    RUN_DEADLINE_GRACE_SECONDS: float = 15.0  # hard stop past the deadline for anything that ignored it
+    
+    # "inline" runs pipelines in the API process; "queue" enqueues them for `python -m app.worker`
+    PIPELINE_MODE: str = "inline"
+    WORKER_CONCURRENCY: int = 4  # runs executed at once per worker process
+    WORKER_POLL_SECONDS: float = 2.0
+    WORKER_HEARTBEAT_SECONDS: float = 15.0
+    WORKER_STALE_SECONDS: float = 120.0  # runs without a heartbeat this long are requeued
+    WORKER_MAX_ATTEMPTS: int = 3
+    
+    # Per-host rate limits for data sources (requests per minute)
+    RATE_LIMIT_DEFAULT_PER_MINUTE: float = 60.0
+    RATE_LIMIT_HOSTS: dict = {"www.reddit.com": 10.0, "newsapi.org": 30.0}
+    RATE_LIMIT_BURST: int = 3
+    HTTP_MAX_RETRIES: int = 3
+    HTTP_BACKOFF_BASE: float = 1.0  # in seconds, doubled per attempt
+    HTTP_BACKOFF_MAX: float = 60.0
+    
+    # Incremental fetches: pages fetched forward to reach a task's watermark
+    WATERMARK_MAX_PAGES: int = 5
+    
+    # Incremental analysis: analysis type -> full re-analysis every N runs; other types always re-analyze
+    INCREMENTAL_ANALYSIS_TYPES: dict = {"summary": 6, "trends": 6, "sentiment": 3}
+    INCREMENTAL_DRIFT_RATIO: float = 0.5  # new items relative to the analyzed window that force a full run
+    INCREMENTAL_WINDOW_ITEMS: int = 50  # recent items re-analyzed on a full run
+    
+    # Near-duplicate collapsing: items within this many differing SimHash bits are one story
+    NEAR_DUPLICATE_ENABLED: bool = True
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 6  # out of 64 bits; LSH tables key on pairs of max_distance + 2 blocks
+    NEAR_DUPLICATE_WINDOW_DAYS: float = 7.0  # stored items later runs are checked against
+    
+    # Per-source request deadlines, counted once the rate limiter lets a request through;
+    # time queued behind the limiter only counts against the run's deadline
+    SOURCE_DEADLINES: dict = {"news": 20.0, "reddit": 15.0}  # in seconds
+    SOURCE_DEADLINE_DEFAULT: float = 20.0
+    
+    # Source fetches shared between tasks
+    SOURCE_FETCH_CACHE_TTL: float = 30.0  # in seconds
+    
+    # WebSocket fan-out
+    WS_QUEUE_SIZE: int = 100  # messages buffered per client
+    WS_SLOW_CONSUMER_POLICY: str = "drop_oldest"  # or "disconnect"
+    WS_HEARTBEAT_SECONDS: float = 30.0
+    WS_SEND_TIMEOUT: float = 10.0
+    WS_MAX_SUBSCRIPTIONS: int = 100  # topics per client
+    
+    # Notification bus between API workers: "memory" (single worker), "redis" (pip install redis) or "sqlite"
+    EVENT_BUS_BACKEND: str = "memory"
+    EVENT_BUS_REDIS_URL: str = "redis://localhost:6379/0"
+    EVENT_BUS_CHANNEL: str = "ai-hot-topic-tracker:events"
+    EVENT_BUS_SQLITE_PATH: str = "./event_bus.db"
+    EVENT_BUS_POLL_INTERVAL: float = 0.5  # in seconds
+    EVENT_BUS_RETENTION_SECONDS: float = 60.0
+    
+    # Result listing
+    RESULTS_PAGE_SIZE: int = 10
+    RESULTS_MAX_PAGE_SIZE: int = 100
+    
+    # Outbound HTTP connection pool
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_TIMEOUT: float = 30.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP2_ENABLED: bool = False
+    
     # CORS
     BACKEND_CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:5173"]
     
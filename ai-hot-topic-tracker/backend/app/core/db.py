@@ -1,16 +1,63 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+# SQLite connections are handed between executor threads
+connect_args = {"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
+
+engine = create_engine(settings.DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Bounded pool so blocking DB work never runs on the event loop
+db_executor = ThreadPoolExecutor(max_workers=settings.DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+@contextmanager
+def session_scope():
+    """Session that commits on success, rolls back on error and always closes"""
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_db(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run fn(session, *args) inside session_scope on the DB executor.
+
+    fn must return plain data, not ORM instances, since the session is
+    closed by the time the result reaches the caller.
+    """
+    def work():
+        with session_scope() as db:
+            return fn(db, *args)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, work)
+
+async def init_db():
+    """Create database tables and apply migrations without blocking the event loop"""
+    from .migrations import run_migrations
+
+    def work():
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(db_executor, work)
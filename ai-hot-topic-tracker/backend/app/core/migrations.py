@@ -0,0 +1,279 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Tuple
+from sqlalchemy import Column, Integer, DateTime, MetaData, Table, select, insert, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+# Applied migration versions, kept outside the ORM models
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+BATCH_SIZE = 200
+
+def _normalize_collected_items(conn: Connection):
+    """Move TaskResult.raw_data blobs into collected_items and link them to their runs"""
+    from ..models.task import TaskResult
+    from ..services.item_store import store_items, link_items
+
+    # Composite (task_id, created_at) index missing from older databases
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_task_results_task_id_created_at ON task_results (task_id, created_at)"
+    ))
+
+    db = Session(bind=conn)
+    last_id = 0
+    while True:
+        rows = (
+            db.query(TaskResult.id, TaskResult.task_id, TaskResult.raw_data)
+            .filter(TaskResult.id > last_id, TaskResult.raw_data.isnot(None))
+            .order_by(TaskResult.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+
+        for row in rows:
+            try:
+                items = json.loads(row.raw_data)
+            except json.JSONDecodeError:
+                items = []
+            link_items(db, row.id, store_items(db, row.task_id, items))
+            db.query(TaskResult).filter(TaskResult.id == row.id).update(
+                {TaskResult.raw_data: None}, synchronize_session=False
+            )
+            last_id = row.id
+        db.flush()
+    db.close()
+
+def _add_columns(conn: Connection, table: Table, names: List[str]):
+    """Add model columns that an older table is missing"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            column = table.c[name]
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+
+def _denormalize_result_summaries(conn: Connection):
+    """Copy summary, sentiment, data_count and analysis_type out of analysis_result into columns"""
+    from ..models.task import TaskResult
+
+    table = TaskResult.__table__
+    _add_columns(conn, table, ["summary", "sentiment", "data_count", "analysis_type"])
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.analysis_result)
+            .where(table.c.id > last_id, table.c.sentiment.is_(None))
+            .order_by(table.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        for row in rows:
+            try:
+                analysis = json.loads(row.analysis_result or "{}")
+            except json.JSONDecodeError:
+                analysis = {}
+            conn.execute(
+                table.update().where(table.c.id == row.id).values(
+                    summary=analysis.get("summary", ""),
+                    sentiment=analysis.get("sentiment", "neutral"),
+                    data_count=analysis.get("data_count", 0),
+                    analysis_type=analysis.get("analysis_type")
+                )
+            )
+            last_id = row.id
+
+def _keyset_pagination_indexes(conn: Connection):
+    """Replace the (task_id, created_at) index with keyset pagination indexes"""
+    from ..models.task import TaskResult
+
+    conn.execute(text("DROP INDEX IF EXISTS ix_task_results_task_id_created_at"))
+    for index in TaskResult.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+    if conn.dialect.name == "sqlite":
+        # CURRENT_TIMESTAMP has no fractional part, while SQLAlchemy binds
+        # datetimes with microseconds; align old rows so comparisons are exact
+        conn.execute(text(
+            "UPDATE task_results SET created_at = strftime('%Y-%m-%d %H:%M:%f', created_at) || '000' "
+            "WHERE created_at NOT LIKE '%.%'"
+        ))
+
+def _backfill_daily_rollups(conn: Connection):
+    """Build task_daily_rollups from the results already stored"""
+    from ..models.task import TaskResult
+    from ..services.rollups import apply_result
+
+    db = Session(bind=conn)
+    last_id = 0
+    while True:
+        rows = (
+            db.query(TaskResult.id, TaskResult.task_id, TaskResult.analysis_result, TaskResult.created_at)
+            .filter(TaskResult.id > last_id)
+            .order_by(TaskResult.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+
+        for row in rows:
+            try:
+                analysis = json.loads(row.analysis_result or "{}")
+            except json.JSONDecodeError:
+                analysis = {}
+            apply_result(db, row.task_id, row.created_at.date(), analysis)
+            last_id = row.id
+        db.flush()
+    db.close()
+
+def _add_run_deadlines(conn: Connection):
+    """Add the per-task run deadline and the partial-result flag"""
+    from ..models.task import Task, TaskResult
+
+    _add_columns(conn, Task.__table__, ["run_timeout"])
+    _add_columns(conn, TaskResult.__table__, ["partial"])
+
+def _add_adaptive_schedule(conn: Connection):
+    """Add the adaptive scheduling bounds and state to tasks"""
+    from ..models.task import Task
+
+    _add_columns(conn, Task.__table__, [
+        "adaptive_schedule", "min_interval", "max_interval", "effective_interval", "novel_items"
+    ])
+
+def _index_near_duplicates(conn: Connection):
+    """Add SimHash columns to collected_items and index the items inside the near-duplicate window"""
+    from ..core.config import settings
+    from ..models.item import CollectedItem, ItemSimhashBand
+    from ..services.near_duplicates import item_simhash, band_values, to_signed
+
+    _add_columns(conn, CollectedItem.__table__, ["simhash", "sources", "duplicates"])
+
+    since = datetime.now(timezone.utc) - timedelta(days=settings.NEAR_DUPLICATE_WINDOW_DAYS)
+    db = Session(bind=conn)
+    last_id = 0
+    while True:
+        rows = (
+            db.query(CollectedItem)
+            .filter(CollectedItem.id > last_id, CollectedItem.created_at >= since)
+            .order_by(CollectedItem.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+
+        for row in rows:
+            signature = item_simhash({"title": row.title, "content": row.content})
+            row.simhash = to_signed(signature)
+            for band, value in band_values(signature, settings.NEAR_DUPLICATE_MAX_DISTANCE):
+                db.add(ItemSimhashBand(
+                    item_id=row.id, band=band, task_id=row.task_id, value=value, created_at=row.created_at
+                ))
+            last_id = row.id
+        db.flush()
+    db.close()
+
+def _split_daily_topics(conn: Connection):
+    """Rebuild per-day key point counts into task_daily_topics from the stored results"""
+    from ..models.rollup import TaskDailyTopic
+    from ..models.task import TaskResult
+    from ..services.rollups import add_topics
+
+    # The old key_topics JSON was truncated; the results hold every key point
+    if "key_topics" in {column["name"] for column in inspect(conn).get_columns("task_daily_rollups")}:
+        conn.execute(text("UPDATE task_daily_rollups SET key_topics = NULL"))
+
+    db = Session(bind=conn)
+    db.query(TaskDailyTopic).delete(synchronize_session=False)
+    last_id = 0
+    while True:
+        rows = (
+            db.query(TaskResult.id, TaskResult.task_id, TaskResult.analysis_result, TaskResult.created_at)
+            .filter(TaskResult.id > last_id)
+            .order_by(TaskResult.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+
+        for row in rows:
+            try:
+                analysis = json.loads(row.analysis_result or "{}")
+            except json.JSONDecodeError:
+                analysis = {}
+            add_topics(db, row.task_id, row.created_at.date(), analysis.get("key_points", []))
+            last_id = row.id
+        db.flush()
+    db.close()
+
+def _rebuild_simhash_bands(conn: Connection):
+    """Rebuild item_simhash_bands with wider LSH keys over pairs of SimHash blocks"""
+    from ..core.config import settings
+    from ..models.item import CollectedItem, ItemSimhashBand
+    from ..services.near_duplicates import band_values, from_signed
+
+    db = Session(bind=conn)
+    db.query(ItemSimhashBand).delete(synchronize_session=False)
+    since = datetime.now(timezone.utc) - timedelta(days=settings.NEAR_DUPLICATE_WINDOW_DAYS)
+    last_id = 0
+    while True:
+        rows = (
+            db.query(CollectedItem.id, CollectedItem.task_id, CollectedItem.simhash, CollectedItem.created_at)
+            .filter(CollectedItem.id > last_id, CollectedItem.created_at >= since, CollectedItem.simhash.isnot(None))
+            .order_by(CollectedItem.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+
+        for row in rows:
+            for band, value in band_values(from_signed(row.simhash), settings.NEAR_DUPLICATE_MAX_DISTANCE):
+                db.add(ItemSimhashBand(
+                    item_id=row.id, band=band, task_id=row.task_id, value=value, created_at=row.created_at
+                ))
+            last_id = row.id
+        db.flush()
+    db.close()
+
+# Ordered (version, migration) pairs; each runs once in its own transaction
+MIGRATIONS: List[Tuple[int, Callable[[Connection], None]]] = [
+    (1, _normalize_collected_items),
+    (2, _denormalize_result_summaries),
+    (3, _keyset_pagination_indexes),
+    (4, _backfill_daily_rollups),
+    (5, _add_run_deadlines),
+    (6, _add_adaptive_schedule),
+    (7, _index_near_duplicates),
+    (8, _split_daily_topics),
+    (9, _rebuild_simhash_bands),
+]
+
+def run_migrations(engine: Engine):
+    """Apply pending data/index migrations after create_all has created new tables"""
+    _metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    for version, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"Applying database migration {version}: {migrate.__doc__}")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(insert(schema_migrations).values(version=version))
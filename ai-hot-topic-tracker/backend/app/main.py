@@ -1,9 +1,9 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from datetime import datetime
 import json
-import asyncio
 from contextlib import asynccontextmanager
 from fastapi import Request
 
@@ -13,8 +13,20 @@ from .agents.data_collection_agent import DataCollectionAgent
 from .agents.analysis_agent import AnalysisAgent
 from .agents.results_agent import ResultsAgent
 from .core.config import settings
-from .core.db import engine, Base
+from .core.db import init_db, db_executor
 from .models.task import Task, TaskResult
+from .models.item import CollectedItem, TaskResultItem, ItemSimhashBand
+from .models.rollup import TaskDailyRollup, TaskDailyTopic
+from .models.watermark import SourceWatermark
+from .models.lease import SchedulerLease
+from .models.task_run import TaskRun
+from .services.http_pool import HTTPClientPool
+from .services.data_sources import data_source_manager
+from .services.ai_service import ai_service
+from .services.broadcaster import WebSocketBroadcaster, WILDCARD, task_topic, keyword_topic
+from .services.event_bus import create_event_bus
+from .services.deadline import Deadline
+from .services.near_duplicates import NearDuplicateFilter
 
 class MCP:
     """Master Control Program - Central orchestrator for all agents"""
@@ -27,7 +39,14 @@ class MCP:
         self.results_agent = ResultsAgent(self)
         
         # WebSocket connections for real-time updates
-        self.active_connections: List[WebSocket] = []
+        self.broadcaster = WebSocketBroadcaster(
+            queue_size=settings.WS_QUEUE_SIZE,
+            slow_consumer_policy=settings.WS_SLOW_CONSUMER_POLICY,
+            heartbeat_seconds=settings.WS_HEARTBEAT_SECONDS,
+            send_timeout=settings.WS_SEND_TIMEOUT,
+            max_subscriptions=settings.WS_MAX_SUBSCRIPTIONS
+        )
+        self.event_bus = create_event_bus()
     
     async def create_task(self, task_config: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new task via Task Agent"""
@@ -41,39 +60,46 @@ class MCP:
         """Delete a task via Task Agent"""
         return await self.task_agent.delete_task(task_id)
     
-    async def collect_data(self, keywords: str, sources: List[str]) -> List[Dict[str, Any]]:
+    async def collect_data(self, keywords: str, sources: List[str],
+                           watermarks: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """Collect data via Data Collection Agent"""
-        return await self.data_collection_agent.collect_data(keywords, sources)
+        return await self.data_collection_agent.collect_data(keywords, sources, watermarks)
+    
+    def stream_data(self, keywords: str, sources: List[str],
+                    watermarks: Optional[Dict[str, Dict[str, Any]]] = None, deadline: Optional[Deadline] = None,
+                    near_duplicates: Optional[NearDuplicateFilter] = None):
+        """Stream cleaned items source by source via Data Collection Agent"""
+        return self.data_collection_agent.stream_data(keywords, sources, watermarks, deadline, near_duplicates)
     
     async def analyze_data(self, data: List[Dict[str, Any]], analysis_type: str = "summary") -> Dict[str, Any]:
         """Analyze data via Analysis Agent"""
         return await self.analysis_agent.analyze_data(data, analysis_type)
     
+    async def update_analysis(self, data: List[Dict[str, Any]], new_items: List[Dict[str, Any]],
+                              previous: Dict[str, Any], analysis_type: str = "summary") -> Dict[str, Any]:
+        """Fold new items into the previous analysis via Analysis Agent"""
+        return await self.analysis_agent.update_analysis(data, new_items, previous, analysis_type)
+    
     async def process_user_message(self, message: str) -> Dict[str, Any]:
         """Process user message via UI Agent"""
         return await self.ui_agent.process_user_message(message)
     
-    async def notify_frontend(self, data: Dict[str, Any]):
-        """Send real-time updates to connected frontend clients"""
-        if self.active_connections:
-            message = json.dumps(data)
-            # Send to all connected clients
-            for connection in self.active_connections[:]:  # Copy list to avoid modification during iteration
-                try:
-                    await connection.send_text(message)
-                except:
-                    # Remove disconnected clients
-                    self.active_connections.remove(connection)
+    def stream_user_message(self, message: str):
+        """Stream the reply to a user message via UI Agent"""
+        return self.ui_agent.stream_user_message(message)
+    
+    async def notify_frontend(self, data: Dict[str, Any], topics: Optional[List[str]] = None):
+        """Send real-time updates to frontend clients subscribed to the topics, or to all clients"""
+        # Every worker's bus subscriber queues the message for its own clients
+        await self.event_bus.publish(topics, json.dumps(data))
     
     async def connect_websocket(self, websocket: WebSocket):
         """Add a new WebSocket connection"""
-        await websocket.accept()
-        self.active_connections.append(websocket)
+        await self.broadcaster.connect(websocket)
     
     def disconnect_websocket(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.broadcaster.disconnect(websocket)
 
 # Initialize MCP
 mcp = MCP()
@@ -81,9 +107,27 @@ mcp = MCP()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Create database tables
-    Base.metadata.create_all(bind=engine)
+    await init_db()
+    
+    # Shared outbound connection pool for data sources and AI providers
+    http_pool = HTTPClientPool()
+    data_source_manager.set_http_pool(http_pool)
+    ai_service.set_http_pool(http_pool)
+    
+    # Receive notifications published by any worker
+    await mcp.event_bus.start(mcp.broadcaster.deliver)
+    
+    # Rehydrate scheduled jobs for active tasks
+    await mcp.task_agent.start()
+    
     yield
-    # Shutdown: cleanup if needed
+    
+    # Shutdown: stop scheduling, then close pooled connections
+    await mcp.task_agent.shutdown()
+    await mcp.event_bus.close()
+    await mcp.broadcaster.close()
+    await http_pool.aclose()
+    db_executor.shutdown(wait=True)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -102,6 +146,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _subscription_topics(message_data: Dict[str, Any]) -> List[str]:
+    """Topics named by a subscribe/unsubscribe message: task_ids, keywords, or "all" for the wildcard"""
+    task_ids = message_data.get("task_ids", [])
+    keywords_list = message_data.get("keywords", [])
+    # A bare string would otherwise be iterated character by character
+    if not isinstance(task_ids, list) or not isinstance(keywords_list, list):
+        raise TypeError("task_ids and keywords must be lists")
+    topics = [task_topic(int(task_id)) for task_id in task_ids]
+    topics += [keyword_topic(str(keywords)) for keywords in keywords_list]
+    if message_data.get("all"):
+        topics.append(WILDCARD)
+    return topics
+
 # WebSocket endpoint for real-time communication
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -115,9 +172,23 @@ async def websocket_endpoint(websocket: WebSocket):
             if message_data.get("type") == "chat_message":
                 # Process chat message via MCP
                 response = await mcp.process_user_message(message_data.get("message", ""))
-                await websocket.send_text(json.dumps(response))
+                mcp.broadcaster.send(websocket, response)
+            
+            elif message_data.get("type") in ("subscribe", "unsubscribe"):
+                try:
+                    topics = _subscription_topics(message_data)
+                except (TypeError, ValueError):
+                    mcp.broadcaster.send(websocket, {"type": "error", "message": "Invalid subscription"})
+                    continue
+                if message_data["type"] == "subscribe":
+                    subscribed = mcp.broadcaster.subscribe(websocket, topics)
+                else:
+                    subscribed = mcp.broadcaster.unsubscribe(websocket, topics)
+                mcp.broadcaster.send(websocket, {"type": "subscriptions", "topics": subscribed})
             
     except WebSocketDisconnect:
+        pass
+    finally:
         mcp.disconnect_websocket(websocket)
 
 # REST API endpoints
@@ -127,7 +198,11 @@ async def read_root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "agents": "operational"}
+    return {
+        "status": "healthy",
+        "agents": "operational",
+        "scheduler_leader": mcp.task_agent.lease.is_leader
+    }
 
 @app.get("/api/tasks")
 async def get_tasks():
@@ -163,20 +238,82 @@ async def delete_task(task_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/results")
-async def get_recent_results():
-    """Get recent analysis results"""
+async def get_recent_results(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    source: Optional[str] = None,
+    analysis_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Get recent analysis results, newest first; pass next_cursor back to get the next page"""
+    try:
+        page = await mcp.results_agent.list_results(
+            cursor=cursor, limit=limit, sentiment=sentiment, source=source,
+            analysis_type=analysis_type, since=since, until=until
+        )
+        return page
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/results/{result_id}/items")
+async def get_result_items(result_id: int):
+    """Get the items collected by a specific run"""
+    try:
+        items = await mcp.results_agent.get_result_items(result_id)
+        return {"items": items}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/tasks/{task_id}/runs")
+async def get_task_runs(task_id: int, limit: int = 20):
+    """Get recent queued, running and finished pipeline runs of a task"""
     try:
-        results = await mcp.results_agent.get_recent_results()
-        return {"results": results}
+        runs = await mcp.task_agent.list_runs(task_id, min(max(limit, 1), 100))
+        return {"runs": runs}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: int):
+    """Get the status and current stage of one pipeline run"""
+    run = await mcp.task_agent.get_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
 @app.get("/api/tasks/{task_id}/results")
-async def get_task_results(task_id: int):
-    """Get results for a specific task"""
+async def get_task_results(
+    task_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    source: Optional[str] = None,
+    analysis_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Get results for a specific task, newest first; pass next_cursor back to get the next page"""
+    try:
+        page = await mcp.results_agent.list_results(
+            task_id=task_id, cursor=cursor, limit=limit, sentiment=sentiment, source=source,
+            analysis_type=analysis_type, since=since, until=until, include_analysis=True
+        )
+        return page
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/tasks/{task_id}/report")
+async def get_task_report(task_id: int, days: int = 7):
+    """Get a summary report for a task over the last N days"""
     try:
-        results = await mcp.task_agent.get_task_results(task_id)
-        return {"results": results}
+        report = await mcp.results_agent.generate_summary_report(task_id, days)
+        return {"report": report}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -198,6 +335,29 @@ async def get_analysis_types():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Get LLM analysis cache and source fetch coalescing counters"""
+    return {
+        "llm_cache": ai_service.cache.stats(),
+        "source_fetches": data_source_manager.fetches.stats()
+    }
+
+@app.get("/api/metrics/rate-limits")
+async def get_rate_limit_metrics():
+    """Get per-host rate limiter state for data sources"""
+    return {"hosts": data_source_manager.rate_limiter.stats()}
+
+@app.get("/api/metrics/websockets")
+async def get_websocket_metrics():
+    """Get WebSocket fan-out and event bus counters"""
+    return {**mcp.broadcaster.stats(), "event_bus": mcp.event_bus.stats()}
+
+@app.get("/api/providers/health")
+async def get_provider_health():
+    """Get AI provider circuit breaker state"""
+    return {"providers": ai_service.provider_health()}
+
 @app.post("/api/chat/stream")
 async def chat_stream(request: Request):
     """SSE聊天流式响应端点"""
@@ -209,31 +369,12 @@ async def chat_stream(request: Request):
             raise HTTPException(status_code=400, detail="消息不能为空")
         
         async def generate_response():
-            # 模拟AI思考和逐步响应
             yield f"data: {json.dumps({'type': 'thinking', 'content': '正在思考...'})}\n\n"
-            await asyncio.sleep(0.5)
             
-            # 处理用户消息
+            # 处理用户消息，模型生成的内容到达即转发
             try:
-                result = await mcp.process_user_message(message)
-                response_text = result.get("message", "处理完成")
-                
-                # 将响应按句子分割，实现打字机效果
-                sentences = response_text.split('。')
-                for i, sentence in enumerate(sentences):
-                    if sentence.strip():
-                        if i == len(sentences) - 1 and not sentence.endswith('。'):
-                            # 最后一句，保持原样
-                            content = sentence
-                        else:
-                            content = sentence + '。'
-                        
-                        yield f"data: {json.dumps({'type': 'content', 'content': content})}\n\n"
-                        await asyncio.sleep(0.3)  # 打字机延迟
-                
-                # 发送完成标识
-                yield f"data: {json.dumps({'type': 'done', 'result': result})}\n\n"
-                
+                async for event in mcp.stream_user_message(message):
+                    yield f"data: {json.dumps(event)}\n\n"
             except Exception as e:
                 yield f"data: {json.dumps({'type': 'error', 'content': f'处理消息时出错: {str(e)}'})}\n\n"
         
@@ -243,6 +384,7 @@ async def chat_stream(request: Request):
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Headers": "*",
             }
@@ -0,0 +1,53 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from ..core.db import Base
+
+class CollectedItem(Base):
+    __tablename__ = "collected_items"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, nullable=False)
+    fingerprint = Column(String(40), nullable=False)  # sha1 of normalized URL or content
+    source = Column(String)
+    type = Column(String)
+    title = Column(String)
+    content = Column(Text)
+    url = Column(String)
+    published_at = Column(DateTime(timezone=True))
+    score = Column(Integer, default=0)
+    simhash = Column(BigInteger)  # 64-bit SimHash of title and content, stored signed
+    sources = Column(Text)  # JSON list of every source a near-duplicate arrived from
+    duplicates = Column(Integer, default=0)  # near-duplicates collapsed into this item
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("task_id", "fingerprint", name="uq_collected_items_task_fingerprint"),
+        Index("ix_collected_items_task_published", "task_id", "published_at"),
+        Index("ix_collected_items_source", "source"),
+    )
+
+class TaskResultItem(Base):
+    """Links a task run to the items it collected"""
+    __tablename__ = "task_result_items"
+    
+    result_id = Column(Integer, ForeignKey("task_results.id", ondelete="CASCADE"), primary_key=True)
+    item_id = Column(Integer, ForeignKey("collected_items.id", ondelete="CASCADE"), primary_key=True)
+    
+    __table_args__ = (
+        Index("ix_task_result_items_item_id", "item_id"),
+    )
+
+class ItemSimhashBand(Base):
+    """LSH index: one row per LSH table (band) of each item in a task's near-duplicate window"""
+    __tablename__ = "item_simhash_bands"
+    
+    item_id = Column(Integer, ForeignKey("collected_items.id", ondelete="CASCADE"), primary_key=True)
+    band = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    value = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    
+    __table_args__ = (
+        Index("ix_item_simhash_bands_lookup", "task_id", "band", "value"),
+        Index("ix_item_simhash_bands_task_created", "task_id", "created_at"),
+    )
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, Date, DateTime, Text
+from sqlalchemy.sql import func
+from ..core.db import Base
+
+class TaskDailyRollup(Base):
+    """Per-task, per-day aggregates maintained as each result is stored"""
+    __tablename__ = "task_daily_rollups"
+    
+    task_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC day of the result
+    runs = Column(Integer, default=0)
+    positive_count = Column(Integer, default=0)
+    negative_count = Column(Integer, default=0)
+    neutral_count = Column(Integer, default=0)
+    data_count_sum = Column(Integer, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class TaskDailyTopic(Base):
+    """Per-task, per-day key point counts; every key point keeps its own row"""
+    __tablename__ = "task_daily_topics"
+    
+    task_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    topic = Column(Text, primary_key=True)
+    count = Column(Integer, default=0)
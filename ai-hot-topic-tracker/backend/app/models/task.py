@@ -1,7 +1,12 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Index
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from ..core.db import Base
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 class Task(Base):
     __tablename__ = "tasks"
     
@@ -11,6 +16,13 @@ class Task(Base):
     sources = Column(String)  # JSON string of source types
     analysis_type = Column(String, default="summary")
     schedule_interval = Column(Integer, default=3600)  # in seconds
+    run_timeout = Column(Integer)  # per-run deadline in seconds; RUN_TIMEOUT_SECONDS when unset
+    # Adaptive scheduling moves the interval between the bounds as topic novelty changes
+    adaptive_schedule = Column(Boolean, default=False)
+    min_interval = Column(Integer)  # ADAPTIVE_MIN_INTERVAL when unset
+    max_interval = Column(Integer)  # ADAPTIVE_MAX_INTERVAL when unset
+    effective_interval = Column(Integer)  # interval currently scheduled; schedule_interval when unset
+    novel_items = Column(Integer)  # items the last run had not seen before
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -20,6 +32,21 @@ class TaskResult(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, index=True)
-    raw_data = Column(Text)  # JSON string of collected data
-    analysis_result = Column(Text)  # JSON string of AI analysis
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    raw_data = deferred(Column(Text))  # Legacy JSON blob; items now live in collected_items
+    analysis_result = deferred(Column(Text))  # JSON string of AI analysis
+    # Denormalized from analysis_result at write time for list endpoints
+    summary = Column(Text)
+    sentiment = Column(String)
+    data_count = Column(Integer, default=0)
+    analysis_type = Column(String)
+    partial = Column(Boolean, default=False)  # a source or the analysis was cut off by the run deadline
+    # Set client-side so stored values compare exactly against keyset cursors
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    
+    # Keyset pagination indexes on (created_at, id), optionally behind a filter column
+    __table_args__ = (
+        Index("ix_task_results_created_at_id", "created_at", "id"),
+        Index("ix_task_results_task_created_id", "task_id", "created_at", "id"),
+        Index("ix_task_results_sentiment_created_id", "sentiment", "created_at", "id"),
+        Index("ix_task_results_type_created_id", "analysis_type", "created_at", "id"),
+    )
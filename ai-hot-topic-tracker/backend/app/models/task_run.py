@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from .task import utcnow
+from ..core.db import Base
+
+class TaskRun(Base):
+    """One queued execution of a task's pipeline, claimed and run by a pipeline worker"""
+    __tablename__ = "task_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    stage = Column(String)  # collecting, analyzing, storing, notifying while running
+    worker_id = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    result_id = Column(Integer)
+    data_count = Column(Integer)
+    error = Column(Text)
+    enqueued_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    started_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        Index("ix_task_runs_status_id", "status", "id"),
+        Index("ix_task_runs_task_id_id", "task_id", "id"),
+    )
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from ..core.db import Base
+
+class SourceWatermark(Base):
+    """Newest item already collected per task and source, for incremental fetches"""
+    __tablename__ = "source_watermarks"
+    
+    task_id = Column(Integer, primary_key=True)
+    source_key = Column(String, primary_key=True)  # "news" or "reddit:<subreddit>"
+    last_published_at = Column(DateTime(timezone=True))
+    last_fullname = Column(String)  # Reddit fullname, e.g. t3_abc123
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
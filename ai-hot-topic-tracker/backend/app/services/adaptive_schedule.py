@@ -0,0 +1,61 @@
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..models.item import CollectedItem
+from ..models.task import Task
+from .item_store import item_fingerprint
+
+def interval_bounds(task: Task) -> Tuple[int, int]:
+    """A task's (min, max) interval in seconds, defaulting to the ADAPTIVE_* settings"""
+    low = task.min_interval or settings.ADAPTIVE_MIN_INTERVAL
+    high = task.max_interval or settings.ADAPTIVE_MAX_INTERVAL
+    return low, max(low, high)
+
+def current_interval(task: Task) -> int:
+    """The interval a task should be scheduled at right now"""
+    if task.adaptive_schedule and task.effective_interval:
+        return task.effective_interval
+    return task.schedule_interval
+
+def next_interval(interval: int, novel_items: int, low: int, high: int) -> int:
+    """Back off exponentially while nothing new appears, speed up while novel items burst"""
+    rate = novel_items * 3600 / max(interval, 1)  # novel items per hour
+    if novel_items == 0:
+        interval = interval * settings.ADAPTIVE_BACKOFF_FACTOR
+    elif rate >= settings.ADAPTIVE_BURST_RATE:
+        interval = interval / settings.ADAPTIVE_SPEEDUP_FACTOR
+    return int(min(max(interval, low), high))
+
+def count_new_items(db: Session, task_id: int, items: List[Dict[str, Any]]) -> int:
+    """How many of the collected items the task has not stored before"""
+    fingerprints = {item_fingerprint(item) for item in items}
+    if not fingerprints:
+        return 0
+    seen = db.query(CollectedItem.id).filter(
+        CollectedItem.task_id == task_id,
+        CollectedItem.fingerprint.in_(list(fingerprints))
+    ).count()
+    return len(fingerprints) - seen
+
+def record_novelty(db: Session, task_id: int, novel_items: int, partial: bool = False) -> Optional[int]:
+    """Store a run's novel item count and move an adaptive task's interval; returns the interval"""
+    task = db.get(Task, task_id)
+    if task is None:
+        return None
+    task.novel_items = novel_items
+    if not task.adaptive_schedule:
+        return task.schedule_interval
+
+    interval = current_interval(task)
+    # A run cut short by its deadline or a failing source may have missed what was new; don't back off on it
+    if not (partial and novel_items == 0):
+        low, high = interval_bounds(task)
+        interval = next_interval(interval, novel_items, low, high)
+    task.effective_interval = interval
+    return interval
+
+def load_interval(db: Session, task_id: int) -> Optional[int]:
+    task = db.get(Task, task_id)
+    if task is None or not task.is_active:
+        return None
+    return current_interval(task)
@@ -1,7 +1,13 @@
 import openai
-import httpx
-from typing import List, Dict, Any
+import json
+import time
+import asyncio
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from ..core.config import settings
+from .http_pool import HTTPClientPool
+from .llm_cache import LLMCache
+from .tokens import estimate_tokens, truncate_to_tokens
+from .circuit_breaker import CircuitBreaker
 
 class AIService:
     def __init__(self):
@@ -9,66 +15,296 @@ class AIService:
         if settings.OPENAI_API_KEY:
             openai.api_key = settings.OPENAI_API_KEY
             self.openai_client = openai
+        self.deepseek_base_url = "https://api.deepseek.com/v1"
+        self.http_pool = HTTPClientPool()
+        self.cache = LLMCache(
+            path=settings.LLM_CACHE_PATH,
+            ttl=settings.LLM_CACHE_TTL,
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            max_persistent_entries=settings.LLM_CACHE_MAX_PERSISTENT_ENTRIES
+        )
+        self.breakers = {
+            provider: CircuitBreaker(
+                provider,
+                window_seconds=settings.CIRCUIT_BREAKER_WINDOW_SECONDS,
+                min_requests=settings.CIRCUIT_BREAKER_MIN_REQUESTS,
+                error_rate_threshold=settings.CIRCUIT_BREAKER_ERROR_RATE,
+                slow_call_seconds=settings.CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+                open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS
+            )
+            for provider in ("openai", "deepseek")
+        }
+    
+    def set_http_pool(self, http_pool: HTTPClientPool):
+        """Use the application-wide connection pool for DeepSeek calls"""
+        self.http_pool = http_pool
     
     async def analyze_with_openai(self, data: List[Dict], analysis_type: str = "summary") -> Dict[str, Any]:
         """Analyze data using OpenAI API"""
+        return await self.complete_with_openai(self._build_prompt(data, analysis_type))
+    
+    async def complete_with_openai(self, prompt: str) -> Dict[str, Any]:
+        """Send a prompt to OpenAI and cache the completion"""
         if not self.openai_client:
             raise ValueError("OpenAI API key not configured")
         
-        prompt = self._build_prompt(data, analysis_type)
-        
         try:
             response = await self.openai_client.ChatCompletion.acreate(
-                model="gpt-3.5-turbo",
+                model=settings.OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": "You are an AI analyst that provides structured analysis of text data."},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=1000
+                max_tokens=settings.LLM_MAX_TOKENS,
+                request_timeout=settings.LLM_REQUEST_TIMEOUT
             )
-            return {
+            result = {
                 "analysis": response.choices[0].message.content,
-                "model": "gpt-3.5-turbo",
+                "model": settings.OPENAI_MODEL,
                 "tokens_used": response.usage.total_tokens
             }
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
+        
+        await self._cache_completion("openai", settings.OPENAI_MODEL, prompt, result)
+        return result
     
     async def analyze_with_deepseek(self, data: List[Dict], analysis_type: str = "summary") -> Dict[str, Any]:
         """Analyze data using DeepSeek API"""
+        return await self.complete_with_deepseek(self._build_prompt(data, analysis_type))
+    
+    async def complete_with_deepseek(self, prompt: str) -> Dict[str, Any]:
+        """Send a prompt to DeepSeek and cache the completion"""
         if not settings.DEEPSEEK_API_KEY:
             raise ValueError("DeepSeek API key not configured")
         
-        prompt = self._build_prompt(data, analysis_type)
+        client = self.http_pool.get_client(self.deepseek_base_url)
+        try:
+            response = await client.post(
+                f"{self.deepseek_base_url}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {settings.DEEPSEEK_API_KEY}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": settings.DEEPSEEK_MODEL,
+                    "messages": [
+                        {"role": "system", "content": "You are an AI analyst that provides structured analysis of text data."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    "max_tokens": settings.LLM_MAX_TOKENS
+                },
+                timeout=settings.LLM_REQUEST_TIMEOUT
+            )
+            response.raise_for_status()
+            result = response.json()
+            
+            completion = {
+                "analysis": result["choices"][0]["message"]["content"],
+                "model": settings.DEEPSEEK_MODEL,
+                "tokens_used": result.get("usage", {}).get("total_tokens", 0)
+            }
+        except Exception as e:
+            raise Exception(f"DeepSeek API error: {str(e)}")
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    "https://api.deepseek.com/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {settings.DEEPSEEK_API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "deepseek-chat",
-                        "messages": [
-                            {"role": "system", "content": "You are an AI analyst that provides structured analysis of text data."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_tokens": 1000
-                    }
-                )
+        await self._cache_completion("deepseek", settings.DEEPSEEK_MODEL, prompt, completion)
+        return completion
+    
+    def is_configured(self, provider: str) -> bool:
+        """Whether the provider has an API key"""
+        if provider == "openai":
+            return self.openai_client is not None
+        if provider == "deepseek":
+            return bool(settings.DEEPSEEK_API_KEY)
+        return False
+    
+    def prompt_token_budget(self) -> int:
+        """Prompt content tokens per request that every configured provider's model accepts"""
+        budgets = [
+            settings.ANALYSIS_MODEL_TOKEN_BUDGETS.get(model, settings.ANALYSIS_PROMPT_TOKEN_BUDGET)
+            for provider, model in (("openai", settings.OPENAI_MODEL), ("deepseek", settings.DEEPSEEK_MODEL))
+            if self.is_configured(provider)
+        ]
+        return min(budgets) if budgets else settings.ANALYSIS_PROMPT_TOKEN_BUDGET
+    
+    async def complete(self, provider: str, prompt: str) -> Dict[str, Any]:
+        """Send a prompt to a provider through its circuit breaker"""
+        breaker = self.breakers[provider]
+        if not breaker.allow_request():
+            raise Exception(f"{provider} circuit breaker is {breaker.state}")
+        
+        complete = self.complete_with_openai if provider == "openai" else self.complete_with_deepseek
+        started = time.monotonic()
+        try:
+            result = await complete(prompt)
+        except asyncio.CancelledError:
+            # A cancelled hedge says nothing about provider health
+            breaker.release_probe()
+            raise
+        except Exception:
+            breaker.record_failure(time.monotonic() - started)
+            raise
+        
+        breaker.record_success(time.monotonic() - started)
+        return result
+    
+    def provider_health(self) -> List[Dict[str, Any]]:
+        """Circuit breaker state for every provider"""
+        return [breaker.snapshot() for breaker in self.breakers.values()]
+    
+    async def stream_with_openai(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Stream completion tokens from OpenAI as they arrive"""
+        if not self.openai_client:
+            raise ValueError("OpenAI API key not configured")
+        
+        try:
+            response = await self.openai_client.ChatCompletion.acreate(
+                model=settings.OPENAI_MODEL,
+                messages=messages,
+                max_tokens=settings.LLM_MAX_TOKENS,
+                request_timeout=settings.LLM_REQUEST_TIMEOUT,
+                stream=True
+            )
+            async for chunk in response:
+                content = chunk["choices"][0]["delta"].get("content")
+                if content:
+                    yield content
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+    
+    async def stream_with_deepseek(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Stream completion tokens from DeepSeek's SSE endpoint as they arrive"""
+        if not settings.DEEPSEEK_API_KEY:
+            raise ValueError("DeepSeek API key not configured")
+        
+        client = self.http_pool.get_client(self.deepseek_base_url)
+        try:
+            async with client.stream(
+                "POST",
+                f"{self.deepseek_base_url}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {settings.DEEPSEEK_API_KEY}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": settings.DEEPSEEK_MODEL,
+                    "messages": messages,
+                    "max_tokens": settings.LLM_MAX_TOKENS,
+                    "stream": True
+                },
+                timeout=settings.LLM_REQUEST_TIMEOUT
+            ) as response:
                 response.raise_for_status()
-                result = response.json()
-                
-                return {
-                    "analysis": result["choices"][0]["message"]["content"],
-                    "model": "deepseek-chat",
-                    "tokens_used": result.get("usage", {}).get("total_tokens", 0)
-                }
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    content = json.loads(payload)["choices"][0]["delta"].get("content")
+                    if content:
+                        yield content
+        except Exception as e:
+            raise Exception(f"DeepSeek API error: {str(e)}")
+    
+    async def stream_chat(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Stream a chat reply, falling back to DeepSeek if OpenAI fails before its first token"""
+        providers = [("OpenAI", self.stream_with_openai), ("DeepSeek", self.stream_with_deepseek)]
+        last_error = None
+        
+        for name, stream in providers:
+            started = False
+            try:
+                async for token in stream(messages):
+                    started = True
+                    yield token
+                return
             except Exception as e:
-                raise Exception(f"DeepSeek API error: {str(e)}")
+                # Once tokens reached the client, switching providers would garble the reply
+                if started:
+                    raise
+                print(f"{name} stream failed: {e}")
+                last_error = e
+        
+        raise Exception(f"No AI provider available: {last_error}")
+    
+    async def get_cached_completion(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached completion for this prompt, in provider fallback order"""
+        if not settings.LLM_CACHE_ENABLED:
+            return None
+        
+        # Only providers that could have produced a completion are worth a lookup
+        candidates = [
+            (provider, model)
+            for provider, model in (("openai", settings.OPENAI_MODEL), ("deepseek", settings.DEEPSEEK_MODEL))
+            if self.is_configured(provider)
+        ]
+        if not candidates:
+            return None
+        return await self.cache.get_first(candidates, prompt)
+    
+    async def _cache_completion(self, provider: str, model: str, prompt: str, result: Dict[str, Any]):
+        if settings.LLM_CACHE_ENABLED:
+            await self.cache.set(provider, model, prompt, result)
+    
+    def chunk_items(self, data: List[Dict], token_budget: int) -> List[List[Dict]]:
+        """Split items into batches whose prompt content fits within token_budget"""
+        batches = []
+        current = []
+        current_tokens = 0
+        
+        for item in data:
+            item, tokens = self.fit_item(item, token_budget)
+            if current and current_tokens + tokens > token_budget:
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            
+            current.append(item)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        return batches
+    
+    def fit_item(self, item: Dict, token_budget: int) -> Tuple[Dict, int]:
+        """Prompt tokens an item takes, truncating an item that alone exceeds the budget"""
+        content = item.get("content", str(item))
+        tokens = estimate_tokens(content) + 1  # joining newline
+        if tokens > token_budget:
+            # A single oversized item gets its own truncated batch
+            item = {**item, "content": truncate_to_tokens(content, token_budget - 1)}
+            tokens = token_budget
+        return item, tokens
+    
+    def _build_reduce_prompt(self, partials: List[Dict[str, Any]], analysis_type: str) -> str:
+        """Build the prompt that merges per-batch analyses into one result"""
+        sections = []
+        for i, partial in enumerate(partials, 1):
+            points = "\n".join(f"- {point}" for point in partial.get("key_points", []))
+            sections.append(f"Batch {i}:\nSummary: {partial.get('summary', '')}\nKey points:\n{points}")
+        partials_text = "\n\n".join(sections)
+        
+        return (
+            f"The following are partial {analysis_type} analyses of consecutive batches of the same content. "
+            "Merge them into a single analysis: start with a concise summary paragraph, "
+            "then list the most important key points as bullet points.\n\n"
+            f"{partials_text}"
+        )
     
+    def _build_incremental_prompt(self, previous: Dict[str, Any], new_items: List[Dict], analysis_type: str) -> str:
+        """Build the prompt that updates an earlier analysis with newly collected content"""
+        points = "\n".join(f"- {point}" for point in previous.get("key_points", []))
+        data_text = "\n".join([item.get("content", str(item)) for item in new_items])
+        
+        return (
+            f"The following is the current {analysis_type} analysis of an ongoing topic.\n\n"
+            f"Summary: {previous.get('summary', '')}\nKey points:\n{points}\n\n"
+            "Update it with the new content below: start with a concise summary paragraph of the updated picture, "
+            "then list the most important key points as bullet points, dropping points that no longer matter.\n\n"
+            f"New content:\n{data_text}"
+        )
+
     def _build_prompt(self, data: List[Dict], analysis_type: str) -> str:
         """Build prompt based on analysis type"""
         data_text = "\n".join([item.get("content", str(item)) for item in data])
@@ -0,0 +1,39 @@
+import json
+from typing import List, Dict, Any
+from sqlalchemy.orm import Session
+from ..models.item import CollectedItem
+from ..models.task import TaskResult
+from .item_store import item_to_dict
+
+def load_analysis_state(db: Session, task_id: int, fingerprints: List[str]) -> Dict[str, Any]:
+    """Latest analysis of a task and which of the given item fingerprints it has already stored"""
+    row = (
+        db.query(TaskResult.analysis_result)
+        .filter(TaskResult.task_id == task_id)
+        .order_by(TaskResult.created_at.desc(), TaskResult.id.desc())
+        .first()
+    )
+    previous = None
+    if row and row.analysis_result:
+        try:
+            previous = json.loads(row.analysis_result)
+        except json.JSONDecodeError:
+            previous = None
+    
+    seen = set()
+    if fingerprints:
+        seen = {
+            fingerprint for (fingerprint,) in db.query(CollectedItem.fingerprint).filter(
+                CollectedItem.task_id == task_id,
+                CollectedItem.fingerprint.in_(fingerprints)
+            )
+        }
+    return {"previous": previous, "seen": seen}
+
+def load_recent_items(db: Session, task_id: int, exclude: List[str], limit: int) -> List[Dict[str, Any]]:
+    """Most recently published items of a task, skipping the given fingerprints"""
+    query = db.query(CollectedItem).filter(CollectedItem.task_id == task_id)
+    if exclude:
+        query = query.filter(CollectedItem.fingerprint.notin_(exclude))
+    rows = query.order_by(CollectedItem.published_at.desc(), CollectedItem.id.desc()).limit(limit).all()
+    return [item_to_dict(row) for row in rows]
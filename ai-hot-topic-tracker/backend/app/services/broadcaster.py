@@ -0,0 +1,208 @@
+import asyncio
+import json
+from typing import Dict, Any, Iterable, List, Optional, Set
+from fastapi import WebSocket
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+# Sent when a connection has been idle for a heartbeat interval
+PING_MESSAGE = json.dumps({"type": "ping"})
+
+# Matches every published message; clients start out on it until they subscribe
+WILDCARD = "*"
+
+def task_topic(task_id: int) -> str:
+    return f"task:{task_id}"
+
+def keyword_topic(keywords: str) -> str:
+    """Keyword groups match regardless of case and spacing"""
+    return "keywords:" + " ".join(keywords.lower().split())
+
+class Connection:
+    """One WebSocket client with its own bounded outbound queue and writer task"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.topics: Set[str] = {WILDCARD}
+        self.subscribed = False  # True once the client has chosen its own topics
+
+class WebSocketBroadcaster:
+    """Fans messages out to WebSocket clients without letting a slow client hold up the rest"""
+
+    def __init__(self, queue_size: int, slow_consumer_policy: str, heartbeat_seconds: float, send_timeout: float,
+                 max_subscriptions: int = 100):
+        if slow_consumer_policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.heartbeat_seconds = heartbeat_seconds
+        self.send_timeout = send_timeout
+        self.max_subscriptions = max_subscriptions
+        self._connections: Dict[WebSocket, Connection] = {}
+        # topic -> subscribed connections, so publishing touches only interested clients
+        self._subscribers: Dict[str, Dict[WebSocket, Connection]] = {}
+
+        self.messages = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+
+    async def connect(self, websocket: WebSocket):
+        """Accept a client and start its writer"""
+        await websocket.accept()
+        connection = Connection(websocket, self.queue_size)
+        connection.writer = asyncio.create_task(self._write(connection))
+        self._connections[websocket] = connection
+        self._index(connection, connection.topics)
+
+    def disconnect(self, websocket: WebSocket):
+        """Forget a client and stop its writer; safe to call more than once"""
+        connection = self._connections.pop(websocket, None)
+        if connection is None:
+            return
+        self._unindex(connection, connection.topics)
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        """Add topics for a client, replacing the implicit wildcard on its first subscribe"""
+        connection = self._connections.get(websocket)
+        if connection is None:
+            return []
+        if not connection.subscribed:
+            connection.subscribed = True
+            self._unindex(connection, {WILDCARD})
+            connection.topics.clear()
+
+        new_topics = set()
+        for topic in topics:
+            if len(connection.topics) + len(new_topics) >= self.max_subscriptions:
+                break
+            if topic not in connection.topics:
+                new_topics.add(topic)
+        connection.topics |= new_topics
+        self._index(connection, new_topics)
+        return sorted(connection.topics)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        """Remove topics for a client"""
+        connection = self._connections.get(websocket)
+        if connection is None:
+            return []
+        removed = connection.topics & set(topics)
+        connection.topics -= removed
+        connection.subscribed = True
+        self._unindex(connection, removed)
+        return sorted(connection.topics)
+
+    def publish(self, topics: Iterable[str], data: Dict[str, Any]) -> int:
+        """Serialize once and queue the message for clients subscribed to any of the topics"""
+        return self.deliver(list(topics), json.dumps(data))
+
+    def broadcast(self, data: Dict[str, Any]) -> int:
+        """Serialize once and queue the message for every client; returns the number of clients"""
+        return self.deliver(None, json.dumps(data))
+
+    def deliver(self, topics: Optional[List[str]], message: str) -> int:
+        """Queue an already-serialized message for the clients of these topics, or for every client"""
+        if topics is None:
+            targets = dict(self._connections)
+        else:
+            targets = dict(self._subscribers.get(WILDCARD, {}))
+            for topic in topics:
+                targets.update(self._subscribers.get(topic, {}))
+        if not targets:
+            return 0
+
+        self.messages += 1
+        for connection in targets.values():
+            self._enqueue(connection, message)
+        return len(targets)
+
+    def send(self, websocket: WebSocket, data: Dict[str, Any]):
+        """Queue a message for a single client, behind anything already queued for it"""
+        connection = self._connections.get(websocket)
+        if connection:
+            self._enqueue(connection, json.dumps(data))
+
+    async def close(self):
+        """Stop every writer, e.g. on shutdown"""
+        writers = [connection.writer for connection in self._connections.values() if connection.writer]
+        self._connections.clear()
+        self._subscribers.clear()
+        for writer in writers:
+            writer.cancel()
+        await asyncio.gather(*writers, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self._connections),
+            "messages": self.messages,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "topics": len(self._subscribers),
+            "queued": sum(connection.queue.qsize() for connection in self._connections.values())
+        }
+
+    def _index(self, connection: Connection, topics: Iterable[str]):
+        for topic in topics:
+            self._subscribers.setdefault(topic, {})[connection.websocket] = connection
+
+    def _unindex(self, connection: Connection, topics: Iterable[str]):
+        for topic in topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.pop(connection.websocket, None)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def _enqueue(self, connection: Connection, message: str):
+        try:
+            connection.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.slow_consumer_policy == DROP_OLDEST:
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(message)
+            connection.dropped += 1
+            self.dropped += 1
+        else:
+            print("Disconnecting slow WebSocket client")
+            self.slow_disconnects += 1
+            self.disconnect(connection.websocket)
+            asyncio.create_task(self._close_quietly(connection.websocket))
+
+    async def _write(self, connection: Connection):
+        """Drain a client's queue, pinging it when idle, until the client goes away"""
+        websocket = connection.websocket
+        try:
+            # asyncio.timeout rather than wait_for: no extra task per message
+            while self._connections.get(websocket) is connection:
+                if connection.queue.empty():
+                    try:
+                        async with asyncio.timeout(self.heartbeat_seconds):
+                            message = await connection.queue.get()
+                    except TimeoutError:
+                        message = PING_MESSAGE
+                else:
+                    message = connection.queue.get_nowait()
+                async with asyncio.timeout(self.send_timeout):
+                    await websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Closed or stalled client
+            self.disconnect(websocket)
+            await self._close_quietly(websocket)
+
+    async def _close_quietly(self, websocket: WebSocket):
+        try:
+            # 1013: try again later
+            await websocket.close(code=1013)
+        except Exception:
+            pass
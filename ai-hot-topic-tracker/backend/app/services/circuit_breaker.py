@@ -0,0 +1,109 @@
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+class CircuitBreaker:
+    """Per-provider circuit breaker over a rolling window of call outcomes and latencies"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, window_seconds: float, min_requests: int,
+                 error_rate_threshold: float, slow_call_seconds: float, open_seconds: float):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._calls = deque()  # (timestamp, ok, latency)
+
+    def is_available(self) -> bool:
+        """False while open and still cooling down; does not take the half-open probe"""
+        return not (self.state == self.OPEN and time.monotonic() - self.opened_at < self.open_seconds)
+
+    def allow_request(self) -> bool:
+        """Whether a call may be sent to the provider right now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            # Let a single probe through to test recovery
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self, latency: float):
+        if self.state == self.HALF_OPEN:
+            self._close()
+        self._record(True, latency)
+
+    def record_failure(self, latency: float):
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self._record(False, latency)
+
+    def release_probe(self):
+        """Give back a half-open probe slot whose call was cancelled"""
+        self._probe_in_flight = False
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency percentile of successful calls in the window, None without samples"""
+        self._prune()
+        latencies = sorted(latency for _, ok, latency in self._calls if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile * (len(latencies) - 1))))
+        return latencies[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._prune()
+        total = len(self._calls)
+        failures = sum(1 for _, ok, _ in self._calls if not ok)
+        p95 = self.latency_percentile(0.95)
+        return {
+            "provider": self.name,
+            "state": self.state,
+            "window_requests": total,
+            "error_rate": round(failures / total, 3) if total else 0.0,
+            "p95_latency": round(p95, 3) if p95 is not None else None
+        }
+
+    def _record(self, ok: bool, latency: float):
+        self._calls.append((time.monotonic(), ok, latency))
+        self._prune()
+
+        if self.state == self.CLOSED and len(self._calls) >= self.min_requests:
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            p95 = self.latency_percentile(0.95)
+            if failures / len(self._calls) >= self.error_rate_threshold or (
+                p95 is not None and p95 >= self.slow_call_seconds
+            ):
+                self._open()
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _open(self):
+        print(f"Circuit breaker for {self.name} opened")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def _close(self):
+        print(f"Circuit breaker for {self.name} closed")
+        self.state = self.CLOSED
+        self._probe_in_flight = False
+        self._calls.clear()
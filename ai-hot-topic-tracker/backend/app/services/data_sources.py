@@ -1,110 +1,267 @@
 import httpx
 import asyncio
-from typing import List, Dict, Any
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Awaitable, Callable
 from ..core.config import settings
+from .http_pool import HTTPClientPool
+from .singleflight import SingleFlight
+from .rate_limit import RateLimiter
+from .deadline import Deadline
+from .item_store import parse_published_at
 
 class NewsAPISource:
-    def __init__(self):
+    def __init__(self, http_pool: HTTPClientPool, rate_limiter: RateLimiter):
         self.api_key = settings.NEWS_API_KEY
         self.base_url = "https://newsapi.org/v2"
+        self.http_pool = http_pool
+        self.rate_limiter = rate_limiter
     
-    async def fetch_news(self, keywords: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Fetch news articles from NewsAPI"""
+    async def fetch_news(self, keywords: str, limit: int = 10,
+                         since: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fetch news articles from NewsAPI, only those newer than `since` when given;
+        returns them with the horizon after which none were left out (None if none were)"""
         if not self.api_key:
             raise ValueError("News API key not configured")
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
+        client = self.http_pool.get_client(self.base_url)
+        params = {
+            "q": keywords,
+            "apiKey": self.api_key,
+            "pageSize": limit,
+            "sortBy": "publishedAt"
+        }
+        if since:
+            params["from"] = since
+        
+        try:
+            articles = []
+            # Without a watermark only the latest page is wanted; with one, page forward until reaching it
+            max_pages = settings.WATERMARK_MAX_PAGES if since else 1
+            for page in range(1, max_pages + 1):
+                response = await self.rate_limiter.request(
+                    client,
+                    "GET",
                     f"{self.base_url}/everything",
-                    params={
-                        "q": keywords,
-                        "apiKey": self.api_key,
-                        "pageSize": limit,
-                        "sortBy": "publishedAt"
-                    }
+                    send_timeout=settings.SOURCE_DEADLINES.get("news", settings.SOURCE_DEADLINE_DEFAULT),
+                    params={**params, "page": page}
                 )
                 response.raise_for_status()
                 data = response.json()
                 
-                articles = []
-                for article in data.get("articles", []):
+                page_articles = data.get("articles", [])
+                reached_watermark = False
+                for article in page_articles:
+                    published_at = article.get("publishedAt")
+                    # `from` is inclusive; the watermark article itself was already seen
+                    if since and published_at and published_at <= since:
+                        reached_watermark = True
+                        continue
                     articles.append({
                         "title": article.get("title"),
                         "content": article.get("description") or article.get("content", ""),
                         "url": article.get("url"),
                         "source": article.get("source", {}).get("name"),
-                        "published_at": article.get("publishedAt"),
-                        "type": "news"
+                        "published_at": published_at,
+                        "type": "news",
+                        "watermark_key": "news"
                     })
                 
-                return articles
-            except Exception as e:
-                raise Exception(f"NewsAPI error: {str(e)}")
+                if reached_watermark or len(page_articles) < limit:
+                    return articles, since
+            
+            # Out of pages before reaching `since`; older articles were left out
+            return articles, articles[-1]["published_at"] if articles else since
+        except Exception as e:
+            raise Exception(f"NewsAPI error: {str(e)}")
 
 class RedditSource:
-    def __init__(self):
+    def __init__(self, http_pool: HTTPClientPool, rate_limiter: RateLimiter):
         self.base_url = "https://www.reddit.com"
+        self.http_pool = http_pool
+        self.rate_limiter = rate_limiter
     
-    async def fetch_reddit_posts(self, subreddit: str, keywords: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Fetch Reddit posts (using public JSON API)"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/r/{subreddit}/search.json",
-                    params={
-                        "q": keywords,
-                        "limit": limit,
-                        "sort": "new"
-                    },
-                    headers={"User-Agent": "AI-Hot-Topic-Tracker/1.0"}
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-                posts = []
-                for post in data.get("data", {}).get("children", []):
-                    post_data = post.get("data", {})
-                    posts.append({
-                        "title": post_data.get("title"),
-                        "content": post_data.get("selftext", ""),
-                        "url": f"https://reddit.com{post_data.get('permalink')}",
-                        "source": f"r/{subreddit}",
-                        "score": post_data.get("score", 0),
-                        "type": "reddit"
-                    })
+    async def fetch_reddit_posts(self, subreddit: str, keywords: str, limit: int = 10,
+                                 since: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fetch Reddit posts (using public JSON API) newest first, paging back to publish time `since` when given;
+        returns them with the horizon after which none were left out (None if none were)"""
+        client = self.http_pool.get_client(self.base_url)
+        try:
+            since_ts = datetime.fromisoformat(since.replace("Z", "+00:00")).timestamp() if since else None
+            posts = []
+            after = None
+            # Paging back from the newest post needs no watermark post to exist, and a quiet
+            # subreddit costs one request; without a watermark only the latest page is wanted
+            max_pages = settings.WATERMARK_MAX_PAGES if since else 1
+            for _ in range(max_pages):
+                children, after = await self._search(client, subreddit, keywords, limit, after=after)
+                reached_watermark = False
+                for child in children:
+                    post_data = child.get("data", {})
+                    if since_ts is not None and (post_data.get("created_utc") or 0) <= since_ts:
+                        reached_watermark = True
+                        continue
+                    posts.append(self._to_post(post_data, subreddit))
                 
-                return posts
-            except Exception as e:
-                raise Exception(f"Reddit API error: {str(e)}")
+                if reached_watermark or not after or len(children) < limit:
+                    return posts, since
+            
+            return posts, posts[-1]["published_at"] if posts else since
+        except Exception as e:
+            raise Exception(f"Reddit API error: {str(e)}")
+    
+    async def _search(self, client: httpx.AsyncClient, subreddit: str, keywords: str, limit: int,
+                      **paging: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of newest-first search results and the `after` cursor to the next older page"""
+        params = {
+            "q": keywords,
+            "limit": limit,
+            "sort": "new"
+        }
+        params.update({key: value for key, value in paging.items() if value})
+        
+        response = await self.rate_limiter.request(
+            client,
+            "GET",
+            f"{self.base_url}/r/{subreddit}/search.json",
+            send_timeout=settings.SOURCE_DEADLINES.get("reddit", settings.SOURCE_DEADLINE_DEFAULT),
+            params=params,
+            headers={"User-Agent": "AI-Hot-Topic-Tracker/1.0"}
+        )
+        response.raise_for_status()
+        data = response.json().get("data", {})
+        return data.get("children", []), data.get("after")
+    
+    def _to_post(self, post_data: Dict[str, Any], subreddit: str) -> Dict[str, Any]:
+        return {
+            "title": post_data.get("title"),
+            "content": post_data.get("selftext", ""),
+            "url": f"https://reddit.com{post_data.get('permalink')}",
+            "source": f"r/{subreddit}",
+            "score": post_data.get("score", 0),
+            "published_at": datetime.fromtimestamp(post_data["created_utc"], tz=timezone.utc).isoformat() if post_data.get("created_utc") else None,
+            "fullname": post_data.get("name"),
+            "type": "reddit",
+            "watermark_key": f"reddit:{subreddit}"
+        }
 
 class DataSourceManager:
     def __init__(self):
-        self.news_source = NewsAPISource()
-        self.reddit_source = RedditSource()
+        self.http_pool = HTTPClientPool()
+        self.rate_limiter = RateLimiter()
+        self.news_source = NewsAPISource(self.http_pool, self.rate_limiter)
+        self.reddit_source = RedditSource(self.http_pool, self.rate_limiter)
+        # Tasks sharing keywords reuse one upstream fetch
+        self.fetches = SingleFlight(ttl=settings.SOURCE_FETCH_CACHE_TTL)
+    
+    def set_http_pool(self, http_pool: HTTPClientPool):
+        """Use the application-wide connection pool for all sources"""
+        self.http_pool = http_pool
+        self.news_source.http_pool = http_pool
+        self.reddit_source.http_pool = http_pool
     
-    async def collect_data(self, keywords: str, sources: List[str]) -> List[Dict[str, Any]]:
-        """Collect data from multiple sources"""
+    async def collect_data(self, keywords: str, sources: List[str],
+                           watermarks: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Collect data from multiple sources, only items past each source's watermark when given"""
         all_data = []
-        tasks = []
+        async for items in self.stream_data(keywords, sources, watermarks):
+            all_data.extend(items)
+        return all_data
+    
+    async def stream_data(self, keywords: str, sources: List[str],
+                          watermarks: Optional[Dict[str, Dict[str, Any]]] = None,
+                          deadline: Optional[Deadline] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield each source's items as soon as that source completes; sources past their deadline yield nothing"""
+        watermarks = watermarks or {}
+        # Coalescing key only; upstream gets the keywords as typed, since "OR"/"AND" are case-sensitive there
+        query = self._normalize_query(keywords)
+        fetches = []
         
         if "news" in sources:
-            tasks.append(self.news_source.fetch_news(keywords))
+            since = watermarks.get("news", {}).get("published_at")
+            fetches.append(("news", self._fetch_shared(
+                ("news", query), since,
+                lambda since: self.news_source.fetch_news(keywords, since=since)
+            )))
         
         if "reddit" in sources:
             # Default to popular subreddits for the keywords
             subreddits = ["technology", "news", "worldnews"]
             for subreddit in subreddits:
-                tasks.append(self.reddit_source.fetch_reddit_posts(subreddit, keywords))
+                since = watermarks.get(f"reddit:{subreddit}", {}).get("published_at")
+                fetches.append((f"reddit:{subreddit}", self._fetch_shared(
+                    ("reddit", query, subreddit), since,
+                    lambda since, subreddit=subreddit: self.reddit_source.fetch_reddit_posts(
+                        subreddit, keywords, since=since
+                    )
+                )))
         
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            for result in results:
-                if isinstance(result, Exception):
-                    print(f"Data collection error: {result}")
-                else:
-                    all_data.extend(result)
+        pending = [asyncio.ensure_future(self._fetch_with_deadline(name, fetch, deadline)) for name, fetch in fetches]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                items = await next_done
+                if items:
+                    # Results may be shared with other tasks; copy the items
+                    yield [dict(item) for item in items]
+        finally:
+            # The consumer stopped early; a shared fetch stops once no task is waiting for it
+            for fetch in pending:
+                fetch.cancel()
+    
+    async def _fetch_shared(self, key: Tuple, since: Optional[str],
+                            fetch: Callable[[Optional[str]], Awaitable[Tuple[List[Dict[str, Any]], Optional[str]]]]
+                            ) -> List[Dict[str, Any]]:
+        """Items newer than this task's watermark `since`, from the one fetch shared by every task
+        with the same query; a shared fetch that stopped short of `since` is redone for it alone"""
+        async def run(since: Optional[str] = since) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
+            items, horizon = await fetch(since)
+            return items, horizon, since
         
-        return all_data
+        items, horizon, fetched_since = await self.fetches.do(key, run)
+        if fetched_since != since and not self._covers(horizon, since):
+            items, horizon, fetched_since = await self.fetches.do(key + (("since", since),), run)
+        return self._newer_than(items, since)
+    
+    def _covers(self, horizon: Optional[str], since: Optional[str]) -> bool:
+        """Whether a fetch that left out only items up to horizon has everything newer than since;
+        without a watermark the latest page is wanted, which only a fetch without one is sure to hold"""
+        if horizon is None:
+            return True
+        if since is None:
+            return False
+        since_at, horizon_at = parse_published_at(since), parse_published_at(horizon)
+        return since_at is not None and horizon_at is not None and since_at >= horizon_at
+    
+    def _newer_than(self, items: List[Dict[str, Any]], since: Optional[str]) -> List[Dict[str, Any]]:
+        since_at = parse_published_at(since)
+        if since_at is None:
+            return items
+        newer = []
+        for item in items:
+            published_at = parse_published_at(item.get("published_at"))
+            if published_at is None or published_at > since_at:
+                newer.append(item)
+        return newer
+    
+    async def _fetch_with_deadline(self, name: str, fetch: Awaitable[List[Dict[str, Any]]],
+                                   run_deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """Await one source within the run's deadline, logging failures instead of raising;
+        the source's own deadline applies to each of its requests once rate limiting lets it through"""
+        timeout = run_deadline.timeout() if run_deadline is not None else None
+        try:
+            return await asyncio.wait_for(fetch, timeout=timeout)
+        except asyncio.TimeoutError:
+            limit = f"{timeout:.1f}s" if timeout is not None else "its deadline"
+            print(f"Data collection from {name} exceeded {limit}, continuing without it")
+            if run_deadline is not None:
+                run_deadline.note(f"source_timeout:{name}")
+        except Exception as e:
+            print(f"Data collection error: {e}")
+            if run_deadline is not None:
+                run_deadline.note(f"source_error:{name}")
+        return []
+    
+    def _normalize_query(self, keywords: str) -> str:
+        """Case and whitespace differences should not defeat coalescing, except in boolean operators"""
+        return " ".join(word if word in ("AND", "OR", "NOT") else word.lower() for word in keywords.split())
 
 data_source_manager = DataSourceManager()
@@ -0,0 +1,31 @@
+import time
+from typing import List, Optional
+
+class Deadline:
+    """Time budget for one task run; each stage derives its timeouts from what is left"""
+    
+    def __init__(self, seconds: float, parent: Optional["Deadline"] = None):
+        self.expires_at = time.monotonic() + max(0.0, seconds)
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+        # Stages of one run share the record of what was cut short
+        self.cut_short: List[str] = parent.cut_short if parent is not None else []
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+    
+    def timeout(self, cap: Optional[float] = None, reserve: float = 0.0) -> float:
+        """Seconds a call may take: what is left minus a reserve for later stages, at most cap"""
+        seconds = max(0.0, self.remaining() - reserve)
+        return min(seconds, cap) if cap is not None else seconds
+    
+    def stage(self, share: float, reserve: float = 0.0) -> "Deadline":
+        """Sub-deadline for a stage that may use a share of the remaining budget"""
+        return Deadline(self.timeout(reserve=reserve) * share, parent=self)
+    
+    def note(self, reason: str):
+        """Record work that was skipped or cut off, making the run's result partial"""
+        self.cut_short.append(reason)
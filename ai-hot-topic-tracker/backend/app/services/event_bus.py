@@ -0,0 +1,190 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+from ..core.config import settings
+
+# Delivers a serialized message to the local WebSocket clients; topics None means every client
+Deliver = Callable[[Optional[List[str]], str], int]
+
+def encode_event(topics: Optional[List[str]], message: str) -> str:
+    """Topics line, then the already-serialized message; JSON never contains a raw newline"""
+    return json.dumps(topics) + "\n" + message
+
+def decode_event(payload: str) -> Tuple[Optional[List[str]], str]:
+    topics, message = payload.split("\n", 1)
+    return json.loads(topics), message
+
+class InProcessEventBus:
+    """Single-worker bus: publishing delivers straight to this process's clients"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+        self.published = 0
+        self.received = 0
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def publish(self, topics: Optional[List[str]], message: str):
+        self.published += 1
+        if self._deliver:
+            self.received += 1
+            self._deliver(topics, message)
+
+    async def close(self):
+        self._deliver = None
+
+    def stats(self):
+        return {"backend": self.name, "published": self.published, "received": self.received}
+
+class RedisEventBus(InProcessEventBus):
+    """Redis pub/sub: every worker subscribes to one channel and fans out to its own clients"""
+
+    name = "redis"
+
+    def __init__(self, url: str, channel: str):
+        super().__init__()
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url, decode_responses=True)
+        self.channel = channel
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+        self._listener = asyncio.create_task(self._listen())
+
+    async def publish(self, topics: Optional[List[str]], message: str):
+        self.published += 1
+        await self._redis.publish(self.channel, encode_event(topics, message))
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        await self._redis.close()
+
+    async def _listen(self):
+        """Stay subscribed, resubscribing after connection errors"""
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    self.received += 1
+                    self._deliver(*decode_event(item["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Event bus connection error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+class SQLiteEventBus(InProcessEventBus):
+    """Shared SQLite file polled by every worker on the host; no extra service needed"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, poll_interval: float, retention_seconds: float):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._poller: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+        # Only events published after this worker started are delivered
+        self._last_id = await asyncio.to_thread(self._max_id)
+        self._poller = asyncio.create_task(self._poll())
+
+    async def publish(self, topics: Optional[List[str]], message: str):
+        self.published += 1
+        await asyncio.to_thread(self._insert, json.dumps(topics), message)
+
+    async def close(self):
+        if self._poller:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def _poll(self):
+        while True:
+            try:
+                rows = await asyncio.to_thread(self._fetch, self._last_id)
+            except sqlite3.Error as e:
+                print(f"Event bus read error: {e}")
+                rows = []
+            for event_id, topics, message in rows:
+                self._last_id = event_id
+                self.received += 1
+                self._deliver(json.loads(topics), message)
+            if not rows:
+                await asyncio.sleep(self.poll_interval)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            # WAL lets the other workers keep reading while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, topics TEXT NOT NULL, "
+                "message TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_events_created_at ON events (created_at)")
+            self._conn.commit()
+        return self._conn
+
+    def _max_id(self) -> int:
+        with self._lock:
+            row = self._connection().execute("SELECT MAX(id) FROM events").fetchone()
+            return row[0] or 0
+
+    def _insert(self, topics: str, message: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO events (topics, message, created_at) VALUES (?, ?, ?)",
+                (topics, message, now)
+            )
+            conn.execute("DELETE FROM events WHERE created_at < ?", (now - self.retention_seconds,))
+            conn.commit()
+
+    def _fetch(self, last_id: int) -> List[Tuple[int, str, str]]:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT id, topics, message FROM events WHERE id > ? ORDER BY id LIMIT 500", (last_id,)
+            ).fetchall()
+
+def create_event_bus() -> InProcessEventBus:
+    """Build the backend named by EVENT_BUS_BACKEND"""
+    backend = settings.EVENT_BUS_BACKEND
+    if backend == "redis":
+        try:
+            return RedisEventBus(settings.EVENT_BUS_REDIS_URL, settings.EVENT_BUS_CHANNEL)
+        except ImportError:
+            print("EVENT_BUS_BACKEND is redis but the redis package is not installed, using the in-process bus")
+    elif backend == "sqlite":
+        return SQLiteEventBus(
+            settings.EVENT_BUS_SQLITE_PATH,
+            poll_interval=settings.EVENT_BUS_POLL_INTERVAL,
+            retention_seconds=settings.EVENT_BUS_RETENTION_SECONDS
+        )
+    elif backend != "memory":
+        print(f"Unknown EVENT_BUS_BACKEND {backend}, using the in-process bus")
+    return InProcessEventBus()
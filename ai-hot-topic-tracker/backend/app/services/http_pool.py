@@ -0,0 +1,47 @@
+import httpx
+from typing import Dict
+from urllib.parse import urlsplit
+from ..core.config import settings
+
+class HTTPClientPool:
+    """Keeps one pooled httpx.AsyncClient per upstream host"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.http2 = settings.HTTP2_ENABLED and self._http2_available()
+
+    def get_client(self, base_url: str) -> httpx.AsyncClient:
+        """Return the shared client for the host of base_url, creating it on first use"""
+        host = urlsplit(base_url).netloc
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(
+                    settings.HTTP_TIMEOUT,
+                    connect=settings.HTTP_CONNECT_TIMEOUT
+                )
+            )
+            self._clients[host] = client
+        return client
+
+    async def aclose(self):
+        """Close every pooled client"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    def _http2_available(self) -> bool:
+        """HTTP/2 needs the optional h2 package (pip install httpx[http2])"""
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            print("HTTP2_ENABLED is set but the h2 package is not installed, using HTTP/1.1")
+            return False
@@ -0,0 +1,108 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlsplit, urlunsplit
+from sqlalchemy.orm import Session
+from ..models.item import CollectedItem, TaskResultItem
+
+def item_fingerprint(item: Dict[str, Any]) -> str:
+    """Identify an item by its normalized URL, or by its title and content when it has none"""
+    url = (item.get("url") or "").strip()
+    if url:
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        if host.startswith("www."):
+            host = host[4:]
+        key = urlunsplit(("", host, parts.path.rstrip("/"), parts.query, ""))
+    else:
+        key = f"{item.get('title') or ''}\n{item.get('content') or ''}".strip().lower()
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def parse_published_at(value: Any) -> Optional[datetime]:
+    """Parse an ISO-8601 timestamp (as returned by the sources) into an aware datetime"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def store_items(db: Session, task_id: int, items: List[Dict[str, Any]]) -> List[int]:
+    """Insert new items for a task, refresh known ones, and return their ids in order"""
+    by_fingerprint: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        by_fingerprint.setdefault(item_fingerprint(item), item)
+    if not by_fingerprint:
+        return []
+
+    existing = {
+        row.fingerprint: row
+        for row in db.query(CollectedItem).filter(
+            CollectedItem.task_id == task_id,
+            CollectedItem.fingerprint.in_(list(by_fingerprint))
+        )
+    }
+
+    rows = []
+    for fingerprint, item in by_fingerprint.items():
+        row = existing.get(fingerprint)
+        if row is None:
+            row = CollectedItem(
+                task_id=task_id,
+                fingerprint=fingerprint,
+                source=item.get("source"),
+                type=item.get("type"),
+                title=item.get("title"),
+                content=item.get("content"),
+                url=item.get("url"),
+                published_at=parse_published_at(item.get("published_at")),
+                score=item.get("score") or 0,
+                simhash=item.get("simhash"),
+                sources=json.dumps(item["sources"]) if item.get("sources") else None,
+                duplicates=item.get("duplicates") or 0
+            )
+            db.add(row)
+        else:
+            # Scores keep moving on Reddit; keep the latest
+            row.score = item.get("score") or row.score
+            if item.get("sources"):
+                sources = json.loads(row.sources) if row.sources else ([row.source] if row.source else [])
+                row.sources = json.dumps(sources + [source for source in item["sources"] if source not in sources])
+                row.duplicates = (row.duplicates or 0) + (item.get("duplicates") or 0)
+        rows.append(row)
+
+    db.flush()
+    return [row.id for row in rows]
+
+def link_items(db: Session, result_id: int, item_ids: List[int]):
+    """Record which items a task run collected"""
+    db.add_all([TaskResultItem(result_id=result_id, item_id=item_id) for item_id in item_ids])
+
+def item_to_dict(row: CollectedItem) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "title": row.title,
+        "content": row.content,
+        "url": row.url,
+        "source": row.source,
+        "type": row.type,
+        "published_at": row.published_at.isoformat() if row.published_at else None,
+        "score": row.score,
+        "sources": json.loads(row.sources) if row.sources else [row.source],
+        "duplicates": row.duplicates or 0
+    }
+
+def load_result_items(db: Session, result_id: int) -> List[Dict[str, Any]]:
+    """Load the items collected by one task run"""
+    rows = (
+        db.query(CollectedItem)
+        .join(TaskResultItem, TaskResultItem.item_id == CollectedItem.id)
+        .filter(TaskResultItem.result_id == result_id)
+        .order_by(CollectedItem.published_at.desc())
+        .all()
+    )
+    return [item_to_dict(row) for row in rows]
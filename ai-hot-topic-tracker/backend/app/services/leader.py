@@ -0,0 +1,65 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..models.lease import SchedulerLease
+from ..models.task import utcnow
+from ..core.db import run_db
+
+def try_acquire_lease(db: Session, name: str, holder: str, ttl: float) -> bool:
+    """Take or renew the lease if it is free, expired or already ours"""
+    now = utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    # A single conditional UPDATE is atomic on SQLite and Postgres alike
+    updated = db.query(SchedulerLease).filter(
+        SchedulerLease.name == name,
+        or_(SchedulerLease.holder == holder, SchedulerLease.expires_at < now)
+    ).update({SchedulerLease.holder: holder, SchedulerLease.expires_at: expires_at}, synchronize_session=False)
+    if updated:
+        return True
+    if db.get(SchedulerLease, name) is not None:
+        return False
+    
+    try:
+        with db.begin_nested():
+            db.add(SchedulerLease(name=name, holder=holder, expires_at=expires_at))
+    except IntegrityError:
+        # Another process created it first
+        return False
+    return True
+
+def release_lease(db: Session, name: str, holder: str):
+    """Give the lease up so another process can take over without waiting for expiry"""
+    db.query(SchedulerLease).filter(
+        SchedulerLease.name == name, SchedulerLease.holder == holder
+    ).delete(synchronize_session=False)
+
+class LeaderLease:
+    """This process's claim on a named lease"""
+    
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+    
+    async def renew(self) -> bool:
+        """Acquire or extend the lease; any error counts as not leading"""
+        try:
+            self.is_leader = await run_db(try_acquire_lease, self.name, self.holder, self.ttl)
+        except Exception as e:
+            print(f"Lease {self.name} renewal failed: {e}")
+            self.is_leader = False
+        return self.is_leader
+    
+    async def release(self):
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        try:
+            await run_db(release_lease, self.name, self.holder)
+        except Exception as e:
+            print(f"Lease {self.name} release failed: {e}")
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+class LLMCache:
+    """Content-addressed cache for LLM completions with an in-memory LRU tier and a SQLite tier"""
+
+    def __init__(self, path: str, ttl: int, max_entries: int, max_persistent_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_persistent_entries = max_persistent_entries
+
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str) -> str:
+        """Hash (provider, model, prompt) into a cache key"""
+        payload = json.dumps([provider, model, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, provider: str, model: str, prompt: str) -> Optional[Dict[str, Any]]:
+        """Return a cached completion, or None on a miss"""
+        return await self.get_first([(provider, model)], prompt)
+
+    async def get_first(self, candidates: List[Tuple[str, str]], prompt: str) -> Optional[Dict[str, Any]]:
+        """Return the completion cached for the first (provider, model) that has one, counting one hit or miss"""
+        keys = [self.make_key(provider, model, prompt) for provider, model in candidates]
+        now = time.time()
+
+        for key in keys:
+            entry = self._memory.get(key)
+            if not entry:
+                continue
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return value
+            del self._memory[key]
+
+        try:
+            stored = await asyncio.to_thread(self._load, keys, now) if keys else None
+        except sqlite3.Error as e:
+            print(f"LLM cache read error: {e}")
+            stored = None
+
+        if stored:
+            key, expires_at, value = stored
+            self._remember(key, expires_at, value)
+            self.hits += 1
+            self.persistent_hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, provider: str, model: str, prompt: str, value: Dict[str, Any]):
+        """Store a completion in both tiers"""
+        key = self.make_key(provider, model, prompt)
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, value)
+
+        try:
+            await asyncio.to_thread(self._store, key, expires_at, value)
+        except sqlite3.Error as e:
+            print(f"LLM cache write error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory)
+        }
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load(self, keys: List[str], now: float) -> Optional[Tuple[str, float, Dict[str, Any]]]:
+        """First of keys with a live row, in the order given; one query for all of them"""
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                f"SELECT key, value, expires_at FROM llm_cache WHERE key IN ({', '.join('?' * len(keys))})",
+                keys
+            ).fetchall()
+            found = {row[0]: row for row in rows}
+            expired = [key for key, row in found.items() if row[2] <= now]
+            if expired:
+                conn.executemany("DELETE FROM llm_cache WHERE key = ?", [(key,) for key in expired])
+            row = next((found[key] for key in keys if key in found and found[key][2] > now), None)
+            if row:
+                conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, row[0]))
+            if expired or row:
+                conn.commit()
+            if not row:
+                return None
+            return row[0], row[2], json.loads(row[1])
+
+    def _store(self, key: str, expires_at: float, value: Dict[str, Any]):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, time.time())
+            )
+            # Evict least recently used rows beyond the size bound
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_persistent_entries,)
+            )
+            conn.commit()
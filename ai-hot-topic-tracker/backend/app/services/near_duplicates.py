@@ -0,0 +1,204 @@
+import hashlib
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import and_, or_, exists
+from sqlalchemy.orm import Session
+from ..core.db import run_db
+from ..models.item import CollectedItem, ItemSimhashBand
+from .item_store import item_fingerprint
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 1  # words; on texts this short a one-word edit moves too many bits of longer shingles
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word shingles; similar texts differ in few bits"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) >= SHINGLE_SIZE:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    else:
+        shingles = words
+
+    if not shingles:
+        return 0
+    # Bit strings transposed column by column: a bit is set when most shingle hashes set it
+    hashes = [
+        format(int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+        for shingle in shingles
+    ]
+    half = len(hashes) / 2
+    return int("".join("1" if column.count("1") > half else "0" for column in zip(*hashes)), 2)
+
+def item_simhash(item: Dict[str, Any]) -> int:
+    return simhash(f"{item.get('title') or ''}\n{item.get('content') or ''}")
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+@lru_cache(maxsize=None)
+def band_masks(max_distance: int) -> Tuple[int, ...]:
+    """Bit masks of the LSH tables: the signature is cut into max_distance + 2 blocks and each table
+    keys on one pair of them, so keys are wide (16 bits at max_distance 6) and rarely collide by chance"""
+    blocks = max_distance + 2
+    bounds = [round(i * SIMHASH_BITS / blocks) for i in range(blocks + 1)]
+    block_masks = [((1 << (bounds[i + 1] - bounds[i])) - 1) << bounds[i] for i in range(blocks)]
+    return tuple(a | b for a, b in combinations(block_masks, 2))
+
+def band_values(signature: int, max_distance: int) -> List[Tuple[int, int]]:
+    """(table, key) LSH keys; signatures within max_distance bits differ in at most max_distance
+    blocks, so they agree on some pair of blocks and share that table's key"""
+    return [(band, to_signed(signature & mask)) for band, mask in enumerate(band_masks(max_distance))]
+
+def to_signed(value: int) -> int:
+    """Fit an unsigned 64-bit value into a signed BIGINT column"""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+def from_signed(value: int) -> int:
+    return value + (1 << SIMHASH_BITS) if value < 0 else value
+
+def item_sources(item: Dict[str, Any]) -> List[str]:
+    """Sources an item arrived from, per subreddit for Reddit"""
+    if item.get("sources"):
+        return list(item["sources"])
+    source = item.get("watermark_key") or item.get("source")
+    return [source] if source else []
+
+def merge_item(target: Dict[str, Any], duplicate: Dict[str, Any]):
+    """Fold a near-duplicate into the item that represents it"""
+    target["score"] = (target.get("score") or 0) + (duplicate.get("score") or 0)
+    sources = item_sources(target)
+    sources += [source for source in item_sources(duplicate) if source not in sources]
+    target["sources"] = sources
+    target["duplicates"] = (target.get("duplicates") or 0) + 1 + (duplicate.get("duplicates") or 0)
+
+def index_items(db: Session, task_id: int, item_ids: List[int], max_distance: int):
+    """Add stored items that are not indexed yet to the task's LSH index"""
+    if not item_ids:
+        return
+    rows = db.query(CollectedItem.id, CollectedItem.simhash).filter(
+        CollectedItem.id.in_(item_ids),
+        CollectedItem.simhash.isnot(None),
+        ~exists().where(ItemSimhashBand.item_id == CollectedItem.id)
+    ).all()
+    now = datetime.now(timezone.utc)
+    for row in rows:
+        for band, value in band_values(from_signed(row.simhash), max_distance):
+            db.add(ItemSimhashBand(item_id=row.id, band=band, task_id=task_id, value=value, created_at=now))
+
+def find_stored_duplicates(db: Session, task_id: int, signatures: List[int], max_distance: int,
+                           since: datetime) -> Dict[int, int]:
+    """Id of the nearest stored item within max_distance for each signature, keyed by position"""
+    if not signatures:
+        return {}
+    keys: Dict[int, set] = {}
+    for signature in signatures:
+        for band, value in band_values(signature, max_distance):
+            keys.setdefault(band, set()).add(value)
+
+    rows = (
+        db.query(ItemSimhashBand.band, ItemSimhashBand.value, CollectedItem.id, CollectedItem.simhash)
+        .join(CollectedItem, CollectedItem.id == ItemSimhashBand.item_id)
+        .filter(
+            ItemSimhashBand.task_id == task_id,
+            ItemSimhashBand.created_at >= since,
+            or_(*[and_(ItemSimhashBand.band == band, ItemSimhashBand.value.in_(values))
+                  for band, values in keys.items()])
+        )
+        .all()
+    )
+    buckets: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    for row in rows:
+        buckets.setdefault((row.band, row.value), []).append((row.id, from_signed(row.simhash)))
+
+    matches = {}
+    for position, signature in enumerate(signatures):
+        # Only items sharing one of this signature's keys are candidates
+        best = None
+        for key in band_values(signature, max_distance):
+            for item_id, candidate in buckets.get(key, []):
+                distance = hamming(signature, candidate)
+                if distance <= max_distance and (best is None or distance < best[0]):
+                    best = (distance, item_id)
+        if best:
+            matches[position] = best[1]
+    return matches
+
+def merge_stored_duplicates(db: Session, task_id: int, merges: List[Dict[str, Any]], since: datetime):
+    """Record near-duplicates of stored items on those items and slide the task's window forward"""
+    for merge in merges:
+        row = db.get(CollectedItem, merge["item_id"])
+        if row is None:
+            continue
+        # Scores of a re-collected story are updates, not new votes
+        row.score = max(row.score or 0, merge["score"])
+        sources = json.loads(row.sources) if row.sources else ([row.source] if row.source else [])
+        sources += [source for source in merge["sources"] if source not in sources]
+        row.sources = json.dumps(sources)
+        row.duplicates = (row.duplicates or 0) + merge["duplicates"]
+
+    db.query(ItemSimhashBand).filter(
+        ItemSimhashBand.task_id == task_id,
+        ItemSimhashBand.created_at < since
+    ).delete(synchronize_session=False)
+
+class NearDuplicateFilter:
+    """Collapses near-duplicate items of one run, and items already stored by the task within its window"""
+
+    def __init__(self, task_id: Optional[int], max_distance: int, window_days: float):
+        self.task_id = task_id
+        self.max_distance = max_distance
+        self.since = datetime.now(timezone.utc) - timedelta(days=window_days)
+        self.collected: List[Dict[str, Any]] = []  # every item seen, duplicates included
+        self.collapsed = 0
+        self._merges: List[Dict[str, Any]] = []  # near-duplicates of stored items
+        self._by_fingerprint: Dict[str, Dict[str, Any]] = {}
+        self._index: Dict[Tuple[int, int], List[Tuple[int, Dict[str, Any]]]] = {}
+
+    async def filter(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the items that represent a new story; the rest are merged into their representative"""
+        self.collected.extend(items)
+        signatures = [item_simhash(item) for item in items]
+        stored = {}
+        if self.task_id is not None:
+            stored = await run_db(
+                find_stored_duplicates, self.task_id, signatures, self.max_distance, self.since
+            )
+
+        representatives = []
+        for position, (item, signature) in enumerate(zip(items, signatures)):
+            fingerprint = item_fingerprint(item)
+            target = self._by_fingerprint.get(fingerprint) or self._match(signature)
+            if target is None and position in stored:
+                # Already stored by an earlier run; later copies in this run merge into it too
+                target = {"item_id": stored[position], "score": 0, "sources": [], "duplicates": 0}
+                self._merges.append(target)
+                self._add(fingerprint, signature, target)
+
+            if target is None:
+                item["simhash"] = to_signed(signature)
+                self._add(fingerprint, signature, item)
+                representatives.append(item)
+            else:
+                merge_item(target, item)
+                self.collapsed += 1
+        return representatives
+
+    async def commit(self):
+        """Persist merges into stored items; call once the run's new items are stored"""
+        if self.task_id is not None:
+            await run_db(merge_stored_duplicates, self.task_id, self._merges, self.since)
+
+    def _match(self, signature: int) -> Optional[Dict[str, Any]]:
+        for key in band_values(signature, self.max_distance):
+            for candidate, target in self._index.get(key, []):
+                if hamming(signature, candidate) <= self.max_distance:
+                    return target
+        return None
+
+    def _add(self, fingerprint: str, signature: int, target: Dict[str, Any]):
+        self._by_fingerprint[fingerprint] = target
+        for key in band_values(signature, self.max_distance):
+            self._index.setdefault(key, []).append((signature, target))
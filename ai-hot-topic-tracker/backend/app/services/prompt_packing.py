@@ -0,0 +1,132 @@
+import math
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from ..core.config import settings
+from .item_store import parse_published_at
+from .tokens import estimate_tokens, truncate_to_tokens
+
+def item_value(item: Dict[str, Any], now: Optional[datetime] = None) -> float:
+    """How much an item is worth a place in the prompt, from 0 to 1: score, recency and novelty"""
+    weights = settings.PROMPT_RANK_WEIGHTS
+    now = now or datetime.now(timezone.utc)
+
+    score = max(item.get("score") or 0, 0)
+    score_value = min(1.0, math.log1p(score) / math.log1p(settings.PROMPT_SCORE_SATURATION))
+
+    published_at = parse_published_at(item.get("published_at"))
+    if published_at is None:
+        recency_value = 0.5
+    else:
+        if published_at.tzinfo is None:
+            published_at = published_at.replace(tzinfo=timezone.utc)
+        age_hours = max(0.0, (now - published_at).total_seconds() / 3600)
+        recency_value = 0.5 ** (age_hours / settings.PROMPT_RECENCY_HALF_LIFE_HOURS)
+
+    # Items earlier analyses already covered are marked novel=False
+    novelty_value = 1.0 if item.get("novel", True) else 0.0
+
+    total = sum(weights.values()) or 1.0
+    return (
+        weights.get("score", 0) * score_value
+        + weights.get("recency", 0) * recency_value
+        + weights.get("novelty", 0) * novelty_value
+    ) / total
+
+def item_allowance(value: float, batch_budget: int) -> int:
+    """Tokens an item may keep when not everything fits: more for more valuable items"""
+    low = settings.PROMPT_ITEM_MIN_TOKENS
+    high = max(low, int(batch_budget * settings.PROMPT_ITEM_MAX_SHARE))
+    return int(low + (high - low) * value)
+
+def item_tokens(item: Dict[str, Any]) -> int:
+    """Prompt tokens of an item's content, with its joining newline"""
+    return estimate_tokens(item.get("content", str(item))) + 1
+
+def fit_to_tokens(item: Dict[str, Any], tokens: int) -> Dict[str, Any]:
+    """Copy of the item with its content cut to the given prompt tokens"""
+    return {**item, "content": truncate_to_tokens(item.get("content", str(item)), tokens - 1)}
+
+def decision(item: Dict[str, Any], value: float, tokens: int, packed_tokens: int) -> Dict[str, Any]:
+    return {
+        "title": (item.get("title") or "")[:80],
+        "value": round(value, 3),
+        "tokens": tokens,
+        "packed_tokens": packed_tokens
+    }
+
+def summarize_decisions(decisions: List[Dict[str, Any]], budget: int) -> Dict[str, Any]:
+    """Packing record stored with a result"""
+    return {
+        "budget": budget,
+        "tokens": sum(d["packed_tokens"] for d in decisions),
+        "considered": len(decisions),
+        "packed": sum(1 for d in decisions if d["packed_tokens"]),
+        "truncated": sum(1 for d in decisions if 0 < d["packed_tokens"] < d["tokens"]),
+        "dropped": sum(1 for d in decisions if not d["packed_tokens"]),
+        "items": decisions
+    }
+
+def pack_items(items: List[Dict[str, Any]], batch_budget: int, max_batches: int,
+               now: Optional[datetime] = None) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Pack the most valuable items into at most max_batches requests of batch_budget tokens;
+    returns the batches and a decision per item"""
+    now = now or datetime.now(timezone.utc)
+    ranked = sorted(
+        ((item_value(item, now), item_tokens(item), item) for item in items),
+        key=lambda entry: entry[0], reverse=True
+    )
+    limits = _water_fill(ranked, batch_budget, batch_budget * max_batches)
+
+    batches: List[List[Dict[str, Any]]] = [[] for _ in range(max_batches)]
+    room = [batch_budget] * max_batches
+    decisions = []
+    for (value, tokens, item), limit in zip(ranked, limits):
+        if limit:
+            index = next((i for i, free in enumerate(room) if free >= limit), None)
+            if index is None:
+                # No request has room for all of it; squeeze it into the emptiest one if its minimum fits
+                index = max(range(max_batches), key=room.__getitem__)
+                limit = room[index] if room[index] >= min(tokens, settings.PROMPT_ITEM_MIN_TOKENS) else 0
+        if limit:
+            batches[index].append(item if limit == tokens else fit_to_tokens(item, limit))
+            room[index] -= limit
+        decisions.append(decision(item, value, tokens, limit))
+    return [batch for batch in batches if batch], decisions
+
+def _water_fill(ranked: List[Tuple[float, int, Dict[str, Any]]], batch_budget: int, total_budget: int) -> List[int]:
+    """Tokens each ranked item keeps: nothing is cut when everything fits, otherwise every kept
+    item gets its minimum and the rest of the budget is shared in proportion to value"""
+    tokens = [entry[1] for entry in ranked]
+    if sum(tokens) <= total_budget:
+        return [min(count, batch_budget) for count in tokens]
+
+    floors = [min(count, settings.PROMPT_ITEM_MIN_TOKENS) for count in tokens]
+    high = max(settings.PROMPT_ITEM_MIN_TOKENS, int(batch_budget * settings.PROMPT_ITEM_MAX_SHARE))
+    caps = [min(count, high) for count in tokens]
+    weights = [max(entry[0], 0.05) for entry in ranked]
+
+    # The best items whose minimums fit are kept
+    kept, used = [], 0
+    for i, floor in enumerate(floors):
+        if used + floor <= total_budget:
+            kept.append(i)
+            used += floor
+
+    def limit(i: int, level: float) -> int:
+        return max(floors[i], min(caps[i], int(level * weights[i])))
+
+    low, high_level = 0.0, max(caps) / min(weights)
+    if sum(limit(i, high_level) for i in kept) > total_budget:
+        for _ in range(40):
+            level = (low + high_level) / 2
+            if sum(limit(i, level) for i in kept) <= total_budget:
+                low = level
+            else:
+                high_level = level
+    else:
+        low = high_level
+
+    limits = [0] * len(ranked)
+    for i in kept:
+        limits[i] = limit(i, low)
+    return limits
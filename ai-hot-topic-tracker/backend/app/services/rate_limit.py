@@ -0,0 +1,158 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+import httpx
+from ..core.config import settings
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+class TokenBucket:
+    """Token bucket that queues callers until a request may be sent"""
+
+    def __init__(self, host: str, per_minute: float, burst: int):
+        self.host = host
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+        self.requests = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+        self.throttled = 0
+        self.retries = 0
+
+    async def acquire(self):
+        """Wait (FIFO) until a token is available and take it"""
+        async with self._lock:
+            waited = False
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.requests += 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                if not waited:
+                    self.queued += 1
+                    waited = True
+                self.wait_seconds += delay
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hold every request to this host for the given time, then allow one through"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 1.0
+        self.updated = self.blocked_until
+
+    def observe(self, headers: httpx.Headers):
+        """Honour Reddit-style x-ratelimit-remaining / x-ratelimit-reset headers"""
+        remaining = headers.get("x-ratelimit-remaining")
+        reset = headers.get("x-ratelimit-reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            if float(remaining) < 1:
+                self.pause(float(reset))
+        except ValueError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill(time.monotonic())
+        return {
+            "host": self.host,
+            "rate_per_minute": round(self.rate * 60, 2),
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+            "requests": self.requests,
+            "queued": self.queued,
+            "wait_seconds": round(self.wait_seconds, 1),
+            "throttled": self.throttled,
+            "retries": self.retries
+        }
+
+    def _refill(self, now: float):
+        if now <= self.updated:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RateLimiter:
+    """Per-host token buckets with Retry-After-aware retries"""
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, host: str) -> TokenBucket:
+        if host not in self._buckets:
+            per_minute = settings.RATE_LIMIT_HOSTS.get(host, settings.RATE_LIMIT_DEFAULT_PER_MINUTE)
+            self._buckets[host] = TokenBucket(host, per_minute, settings.RATE_LIMIT_BURST)
+        return self._buckets[host]
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str,
+                      send_timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """Send a request once the host's bucket allows it, retrying throttled and transient failures;
+        send_timeout bounds each attempt from when its token is granted, not the wait for it"""
+        bucket = self.bucket(urlsplit(url).netloc)
+
+        for attempt in range(settings.HTTP_MAX_RETRIES + 1):
+            await bucket.acquire()
+            try:
+                async with asyncio.timeout(send_timeout):
+                    response = await client.request(method, url, **kwargs)
+            except TimeoutError:
+                raise httpx.TimeoutException(f"{method} {url} took longer than {send_timeout}s") from None
+            except httpx.TransportError:
+                if attempt == settings.HTTP_MAX_RETRIES:
+                    raise
+                bucket.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            bucket.observe(response.headers)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == settings.HTTP_MAX_RETRIES:
+                return response
+
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = self._backoff(attempt)
+            bucket.retries += 1
+            if response.status_code == 429:
+                # The next acquire() waits out the pause, along with every other caller
+                bucket.throttled += 1
+                bucket.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {host: bucket.stats() for host, bucket in self._buckets.items()}
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(settings.HTTP_BACKOFF_MAX, settings.HTTP_BACKOFF_BASE * 2 ** attempt))
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        """Parse Retry-After (seconds or HTTP date), capped at HTTP_BACKOFF_MAX"""
+        value = response.headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0.0), settings.HTTP_BACKOFF_MAX)
@@ -0,0 +1,68 @@
+from collections import Counter
+from datetime import date
+from typing import Dict, Any, List
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models.rollup import TaskDailyRollup, TaskDailyTopic
+
+def apply_result(db: Session, task_id: int, day: date, analysis_result: Dict[str, Any]):
+    """Fold one stored result into its task's rollup row for the day"""
+    rollup = db.get(TaskDailyRollup, (task_id, day))
+    if rollup is None:
+        rollup = TaskDailyRollup(
+            task_id=task_id, day=day, runs=0, positive_count=0, negative_count=0,
+            neutral_count=0, data_count_sum=0
+        )
+        db.add(rollup)
+    
+    rollup.runs += 1
+    sentiment = analysis_result.get("sentiment", "neutral")
+    if sentiment == "positive":
+        rollup.positive_count += 1
+    elif sentiment == "negative":
+        rollup.negative_count += 1
+    else:
+        rollup.neutral_count += 1
+    rollup.data_count_sum += analysis_result.get("data_count", 0) or 0
+    
+    add_topics(db, task_id, day, analysis_result.get("key_points", []))
+
+def add_topics(db: Session, task_id: int, day: date, key_points: List[Any]):
+    """Count a result's key points into the task's topic rows for the day"""
+    counts = Counter(point for point in key_points if isinstance(point, str) and point)
+    for topic, count in counts.items():
+        row = db.get(TaskDailyTopic, (task_id, day, topic))
+        if row is None:
+            db.add(TaskDailyTopic(task_id=task_id, day=day, topic=topic, count=count))
+        else:
+            row.count += count
+
+def load_rollups(db: Session, task_id: int, since_day: date) -> List[Dict[str, Any]]:
+    rows = (
+        db.query(TaskDailyRollup)
+        .filter(TaskDailyRollup.task_id == task_id, TaskDailyRollup.day >= since_day)
+        .all()
+    )
+    return [
+        {
+            "runs": row.runs,
+            "positive": row.positive_count,
+            "negative": row.negative_count,
+            "neutral": row.neutral_count,
+            "data_count_sum": row.data_count_sum
+        }
+        for row in rows
+    ]
+
+def load_top_topics(db: Session, task_id: int, since_day: date, limit: int) -> List[str]:
+    """The task's most frequent key points since since_day"""
+    total = func.sum(TaskDailyTopic.count)
+    rows = (
+        db.query(TaskDailyTopic.topic, total)
+        .filter(TaskDailyTopic.task_id == task_id, TaskDailyTopic.day >= since_day)
+        .group_by(TaskDailyTopic.topic)
+        .order_by(total.desc(), TaskDailyTopic.topic)
+        .limit(limit)
+        .all()
+    )
+    return [row[0] for row in rows]
@@ -0,0 +1,130 @@
+from datetime import timedelta
+from typing import List, Dict, Any, Optional
+from sqlalchemy.orm import Session
+from ..models.task_run import TaskRun
+from ..models.task import utcnow
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+def run_to_dict(run: TaskRun) -> Dict[str, Any]:
+    return {
+        "id": run.id,
+        "task_id": run.task_id,
+        "status": run.status,
+        "stage": run.stage,
+        "worker_id": run.worker_id,
+        "attempts": run.attempts,
+        "result_id": run.result_id,
+        "data_count": run.data_count,
+        "error": run.error,
+        "enqueued_at": run.enqueued_at.isoformat() if run.enqueued_at else None,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None
+    }
+
+def enqueue_run(db: Session, task_id: int) -> Dict[str, Any]:
+    """Queue a run of the task unless one is already queued or running"""
+    pending = (
+        db.query(TaskRun)
+        .filter(TaskRun.task_id == task_id, TaskRun.status.in_([QUEUED, RUNNING]))
+        .order_by(TaskRun.id.desc())
+        .first()
+    )
+    if pending:
+        return run_to_dict(pending)
+    run = TaskRun(task_id=task_id, status=QUEUED, enqueued_at=utcnow())
+    db.add(run)
+    db.flush()
+    return run_to_dict(run)
+
+def claim_run(db: Session, worker_id: str) -> Optional[Dict[str, Any]]:
+    """Claim the oldest queued run for this worker, or None when the queue is empty"""
+    now = utcnow()
+    claim = {
+        TaskRun.status: RUNNING,
+        TaskRun.stage: None,
+        TaskRun.worker_id: worker_id,
+        TaskRun.attempts: TaskRun.attempts + 1,
+        TaskRun.started_at: now,
+        TaskRun.heartbeat_at: now
+    }
+    
+    if db.get_bind().dialect.name in ("postgresql", "mysql"):
+        # Concurrent workers skip rows another worker has locked instead of waiting on them
+        run_id = (
+            db.query(TaskRun.id)
+            .filter(TaskRun.status == QUEUED)
+            .order_by(TaskRun.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar()
+        )
+        if run_id is None:
+            return None
+        db.query(TaskRun).filter(TaskRun.id == run_id).update(claim, synchronize_session=False)
+        return run_to_dict(db.get(TaskRun, run_id))
+    
+    # No row locks on SQLite: the status guard makes the UPDATE the claim, retry if another worker won
+    while True:
+        run_id = (
+            db.query(TaskRun.id)
+            .filter(TaskRun.status == QUEUED)
+            .order_by(TaskRun.id)
+            .limit(1)
+            .scalar()
+        )
+        if run_id is None:
+            return None
+        claimed = db.query(TaskRun).filter(
+            TaskRun.id == run_id, TaskRun.status == QUEUED
+        ).update(claim, synchronize_session=False)
+        if claimed:
+            return run_to_dict(db.get(TaskRun, run_id))
+
+def update_run_stage(db: Session, run_id: int, stage: str):
+    db.query(TaskRun).filter(TaskRun.id == run_id).update(
+        {TaskRun.stage: stage, TaskRun.heartbeat_at: utcnow()}, synchronize_session=False
+    )
+
+def heartbeat_runs(db: Session, run_ids: List[int]):
+    """Show that the worker running these is still alive"""
+    if run_ids:
+        db.query(TaskRun).filter(TaskRun.id.in_(run_ids), TaskRun.status == RUNNING).update(
+            {TaskRun.heartbeat_at: utcnow()}, synchronize_session=False
+        )
+
+def finish_run(db: Session, run_id: int, status: str, result_id: Optional[int] = None,
+               data_count: Optional[int] = None, error: Optional[str] = None):
+    db.query(TaskRun).filter(TaskRun.id == run_id).update({
+        TaskRun.status: status,
+        TaskRun.stage: None,
+        TaskRun.result_id: result_id,
+        TaskRun.data_count: data_count,
+        TaskRun.error: error,
+        TaskRun.finished_at: utcnow()
+    }, synchronize_session=False)
+
+def requeue_stale_runs(db: Session, stale_seconds: float, max_attempts: int) -> int:
+    """Requeue runs whose worker stopped heartbeating, failing those out of attempts"""
+    cutoff = utcnow() - timedelta(seconds=stale_seconds)
+    stale = db.query(TaskRun).filter(TaskRun.status == RUNNING, TaskRun.heartbeat_at < cutoff)
+    failed = stale.filter(TaskRun.attempts >= max_attempts).update({
+        TaskRun.status: FAILED,
+        TaskRun.error: "Worker stopped responding",
+        TaskRun.finished_at: utcnow()
+    }, synchronize_session=False)
+    requeued = db.query(TaskRun).filter(TaskRun.status == RUNNING, TaskRun.heartbeat_at < cutoff).update(
+        {TaskRun.status: QUEUED, TaskRun.stage: None, TaskRun.worker_id: None}, synchronize_session=False
+    )
+    return failed + requeued
+
+def list_runs(db: Session, task_id: int, limit: int) -> List[Dict[str, Any]]:
+    runs = db.query(TaskRun).filter(TaskRun.task_id == task_id).order_by(TaskRun.id.desc()).limit(limit).all()
+    return [run_to_dict(run) for run in runs]
+
+def get_run(db: Session, run_id: int) -> Optional[Dict[str, Any]]:
+    run = db.get(TaskRun, run_id)
+    return run_to_dict(run) if run else None
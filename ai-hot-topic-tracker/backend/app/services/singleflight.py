@@ -0,0 +1,70 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one and briefly caches the result"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+
+        self.calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return fn()'s result, sharing one in-flight call per key"""
+        cached = self._results.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.cache_hits += 1
+            return cached[1]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            # Run as its own task so one caller's cancellation does not fail the others
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        else:
+            self.coalesced += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Every caller gave up; stop the call instead of finishing it for nobody
+                    self.abandoned += 1
+                    if self._in_flight.get(key) is task:
+                        del self._in_flight[key]
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._in_flight),
+            "cached_keys": len(self._results)
+        }
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+
+        now = time.monotonic()
+        self._results[key] = (now + self.ttl, task.result())
+        # Drop expired entries so keys from finished windows do not pile up
+        for stale in [k for k, (expires_at, _) in self._results.items() if expires_at <= now]:
+            del self._results[stale]
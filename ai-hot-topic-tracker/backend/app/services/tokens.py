@@ -0,0 +1,22 @@
+import re
+
+# CJK ideographs, kana and hangul are roughly one token per character
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+def estimate_tokens(text: str) -> int:
+    """Cheap offline token estimate (~4 characters per token for latin text)"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down so that its estimate fits within max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Shrink proportionally, then trim until the estimate fits
+    cut = max(0, int(len(text) * max_tokens / estimate_tokens(text)))
+    text = text[:cut]
+    while text and estimate_tokens(text) > max_tokens:
+        text = text[:-max(1, len(text) // 20)]
+    return text
@@ -0,0 +1,47 @@
+from datetime import timezone
+from typing import Dict, Any, List
+from sqlalchemy.orm import Session
+from ..models.watermark import SourceWatermark
+from .item_store import parse_published_at
+
+def load_watermarks(db: Session, task_id: int) -> Dict[str, Dict[str, Any]]:
+    """Watermarks of a task keyed by source, in the formats the sources expect"""
+    rows = db.query(SourceWatermark).filter(SourceWatermark.task_id == task_id).all()
+    watermarks = {}
+    for row in rows:
+        published_at = None
+        if row.last_published_at:
+            value = row.last_published_at
+            if value.tzinfo:
+                value = value.astimezone(timezone.utc)
+            # Same shape as NewsAPI's publishedAt so the two compare as strings
+            published_at = value.strftime("%Y-%m-%dT%H:%M:%SZ")
+        watermarks[row.source_key] = {
+            "published_at": published_at,
+            "fullname": row.last_fullname
+        }
+    return watermarks
+
+def advance_watermarks(db: Session, task_id: int, items: List[Dict[str, Any]]):
+    """Move each source's watermark to the newest item collected in this run"""
+    newest: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        key = item.get("watermark_key")
+        published_at = parse_published_at(item.get("published_at"))
+        if not key or not published_at:
+            continue
+        if key not in newest or published_at > newest[key]["published_at"]:
+            newest[key] = {"published_at": published_at, "fullname": item.get("fullname")}
+    
+    for key, mark in newest.items():
+        row = db.get(SourceWatermark, (task_id, key))
+        if row is None:
+            row = SourceWatermark(task_id=task_id, source_key=key)
+            db.add(row)
+        
+        current = parse_published_at(row.last_published_at)
+        if current and current.tzinfo is None:
+            current = current.replace(tzinfo=timezone.utc)
+        if current is None or mark["published_at"] > current:
+            row.last_published_at = mark["published_at"]
+            row.last_fullname = mark["fullname"]
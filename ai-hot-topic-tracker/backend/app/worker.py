@@ -0,0 +1,139 @@
+"""Pipeline worker: claims queued task runs and executes them outside the API process.
+
+Run with `python -m app.worker [--concurrency N]` alongside an API started with PIPELINE_MODE=queue.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+from typing import Dict, Any
+from .core.config import settings
+from .core.db import init_db, run_db, db_executor
+from .main import mcp
+from .services.http_pool import HTTPClientPool
+from .services.data_sources import data_source_manager
+from .services.ai_service import ai_service
+from .services.broadcaster import task_topic
+from .services.run_queue import (
+    claim_run, update_run_stage, heartbeat_runs, finish_run, requeue_stale_runs, SUCCEEDED, FAILED
+)
+
+class PipelineWorker:
+    """Runs up to `concurrency` claimed task runs at a time until stopped"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running: Dict[int, int] = {}  # run id -> task id
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Stop claiming new runs; runs in progress are finished"""
+        if not self._stopping.is_set():
+            print(f"Worker {self.worker_id} stopping after {len(self._running)} running runs")
+            self._stopping.set()
+
+    async def run(self):
+        await init_db()
+        http_pool = HTTPClientPool()
+        data_source_manager.set_http_pool(http_pool)
+        ai_service.set_http_pool(http_pool)
+        await mcp.event_bus.start(mcp.broadcaster.deliver)
+        if mcp.event_bus.name == "memory":
+            print("EVENT_BUS_BACKEND is memory, results from this worker will not reach API WebSocket clients")
+
+        print(f"Worker {self.worker_id} started with concurrency {self.concurrency}")
+        maintenance = asyncio.create_task(self._maintain())
+        try:
+            await asyncio.gather(*[self._slot() for _ in range(self.concurrency)])
+        finally:
+            maintenance.cancel()
+            await asyncio.gather(maintenance, return_exceptions=True)
+            await mcp.event_bus.close()
+            await http_pool.aclose()
+            db_executor.shutdown(wait=True)
+
+    async def _slot(self):
+        while not self._stopping.is_set():
+            try:
+                run = await run_db(claim_run, self.worker_id)
+            except Exception as e:
+                print(f"Error claiming run: {e}")
+                run = None
+            if run is None:
+                await self._idle(settings.WORKER_POLL_SECONDS)
+                continue
+            await self._process(run)
+
+    async def _process(self, run: Dict[str, Any]):
+        run_id, task_id = run["id"], run["task_id"]
+        self._running[run_id] = task_id
+
+        async def progress(stage: str):
+            await run_db(update_run_stage, run_id, stage)
+            await mcp.notify_frontend(
+                {"type": "task_progress", "task_id": task_id, "run_id": run_id, "stage": stage},
+                topics=[task_topic(task_id)]
+            )
+
+        status, outcome, error = SUCCEEDED, None, None
+        try:
+            outcome = await mcp.task_agent.execute_run(task_id, progress)
+            if outcome and outcome.get("error"):
+                status, error = FAILED, outcome["error"]
+        except Exception as e:
+            print(f"Run {run_id} of task {task_id} failed: {e}")
+            status, error = FAILED, str(e)
+        finally:
+            self._running.pop(run_id, None)
+
+        try:
+            await run_db(
+                finish_run, run_id, status,
+                outcome.get("result_id") if outcome else None,
+                outcome.get("data_count") if outcome else None,
+                error
+            )
+            await mcp.notify_frontend(
+                {"type": "task_progress", "task_id": task_id, "run_id": run_id, "stage": status},
+                topics=[task_topic(task_id)]
+            )
+        except Exception as e:
+            print(f"Error finishing run {run_id}: {e}")
+
+    async def _maintain(self):
+        """Heartbeat our runs and requeue runs abandoned by dead workers"""
+        while True:
+            await asyncio.sleep(settings.WORKER_HEARTBEAT_SECONDS)
+            try:
+                await run_db(heartbeat_runs, list(self._running))
+                requeued = await run_db(requeue_stale_runs, settings.WORKER_STALE_SECONDS, settings.WORKER_MAX_ATTEMPTS)
+                if requeued:
+                    print(f"Recovered {requeued} runs from unresponsive workers")
+            except Exception as e:
+                print(f"Worker maintenance error: {e}")
+
+    async def _idle(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+async def main(concurrency: int):
+    worker = PipelineWorker(concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+    await worker.run()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI Hot Topic Tracker pipeline worker")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY,
+                        help="runs executed at once by this process")
+    args = parser.parse_args()
+    asyncio.run(main(max(1, args.concurrency)))
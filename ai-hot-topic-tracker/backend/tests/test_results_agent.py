@@ -0,0 +1,31 @@
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+from app.core.db import init_db
+from app.agents.results_agent import ResultsAgent
+
+ANALYSIS = {"summary": "s", "sentiment": "neutral", "data_count": 1, "key_points": []}
+
+def test_list_results_filters_by_task_source_id():
+    async def run():
+        await init_db()
+        agent = ResultsAgent(None)
+        reddit = await agent.store_result(1, [{
+            "title": "Reddit post", "content": "a", "url": "https://reddit.com/r/technology/1",
+            "source": "r/technology", "type": "reddit"
+        }], ANALYSIS)
+        news = await agent.store_result(1, [{
+            "title": "News article", "content": "b", "url": "https://example.com/1",
+            "source": "Example News", "type": "news"
+        }], ANALYSIS)
+
+        by_type = await agent.list_results(task_id=1, source="reddit")
+        by_source = await agent.list_results(task_id=1, source="Example News")
+        return reddit["result_id"], news["result_id"], by_type, by_source
+
+    reddit_id, news_id, by_type, by_source = asyncio.run(run())
+    assert [result["id"] for result in by_type["results"]] == [reddit_id]
+    assert [result["id"] for result in by_source["results"]] == [news_id]